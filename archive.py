@@ -0,0 +1,40 @@
+import argparse
+import datetime
+
+import config
+import storage
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--days", type=float, default=90,
+        help="archive events that haven't changed in this many days",
+    )
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--restore", metavar="NAME", help="restore one archived event instead")
+    args = parser.parse_args()
+
+    if config.get().storage == "memory":
+        parser.error("EVENT_STORAGE=memory keeps events in the web process; there is nothing to archive here")
+
+    db = storage.connect()
+    try:
+        archive = db.archive()
+
+        if args.restore is not None:
+            archive.restore(args.restore)
+            print(f"restored {args.restore}")
+            return
+
+        before = datetime.datetime.utcnow() - datetime.timedelta(days=args.days)
+        for name in archive.get_inactive(before):
+            if not args.dry_run:
+                archive.archive(name)
+            print(f"archived {name}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# startup budgets, about twice what a laptop measures (import ~180ms, first
+# response ~200ms or ~490ms with warm-up) so that CI catches regressions
+# without flaking on slower machines
+MAX_IMPORT_MS = 400.0
+MAX_FIRST_REQUEST_MS = 1000.0
+
+FIRST_REQUEST = """
+import time
+t0 = time.perf_counter()
+import config
+import website
+t1 = time.perf_counter()
+app = website.create_app(config.Config(warm_up={warm_up}))
+t2 = time.perf_counter()
+response = app.test_client().get("/")
+assert response.status_code == 200, response.status
+t3 = time.perf_counter()
+response = app.test_client().get("/")
+t4 = time.perf_counter()
+print(t1 - t0, t2 - t1, t3 - t2, t4 - t3)
+"""
+
+
+def run(code: str, workdir: str, tmpdir: str, *options: str):
+    env = dict(os.environ, PYTHONPATH=HERE, TMPDIR=tmpdir)
+    return subprocess.run(
+        [sys.executable, *options, "-c", code],
+        cwd=workdir,
+        env=env,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+
+
+def first_request(workdir: str, tmpdir: str, warm_up: bool):
+    result = run(FIRST_REQUEST.format(warm_up=warm_up), workdir, tmpdir)
+    return [float(x) * 1000 for x in result.stdout.split()]
+
+
+def import_times(workdir: str, tmpdir: str):
+    # -X importtime lines look like "import time:  self [us] | cumulative | name",
+    # with the name indented by nesting depth
+    result = run("import website", workdir, tmpdir, "-X", "importtime")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line.split(":", 1)[1].split("|")
+        times[name.strip()] = (int(self_us) / 1000, int(cumulative_us) / 1000)
+    return times
+
+
+def startup(args):
+    failed = False
+
+    with tempfile.TemporaryDirectory() as workdir:
+        subprocess.run([sys.executable, os.path.join(HERE, "initdb.py")], cwd=workdir, check=True)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            timings = [import_times(workdir, tmpdir) for _ in range(args.repeat)]
+        times = min(timings, key=lambda t: t["website"][1])
+
+        print("slowest imports under website (cumulative ms):")
+        for name, (_, cumulative) in sorted(times.items(), key=lambda kv: -kv[1][1])[:args.top]:
+            print(f"{cumulative:9.1f}  {name}")
+        print()
+
+        import_ms = times["website"][1]
+        if import_ms > args.max_import_ms:
+            print(f"FAIL: importing website took {import_ms:.1f}ms > {args.max_import_ms}ms")
+            failed = True
+
+        print("                      import  factory    first   second  (ms)")
+        for warm_up in (False, True):
+            with tempfile.TemporaryDirectory() as shared:
+                for cache in ("cold", "warm"):
+                    timings = []
+                    for _ in range(args.repeat):
+                        if cache == "cold":
+                            with tempfile.TemporaryDirectory() as tmpdir:
+                                timings.append(first_request(workdir, tmpdir, warm_up))
+                        else:
+                            timings.append(first_request(workdir, shared, warm_up))
+                    best = min(timings, key=sum)
+                    label = f"{cache} cache{', warm-up' if warm_up else ''}"
+                    print(f"{label:<21}" + "".join(f"{t:9.1f}" for t in best))
+
+                    first_ms = sum(best[:3])
+                    if first_ms > args.max_first_request_ms:
+                        print(f"FAIL: {label}: first response after {first_ms:.1f}ms > {args.max_first_request_ms}ms")
+                        failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+def per_request_us(client, url: str, n: int) -> float:
+    client.get(url)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        client.get(url)
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def with_token(args):
+    sys.path.insert(0, HERE)
+    import sqlite3
+
+    import config
+    import initdb
+    import website
+
+    with tempfile.TemporaryDirectory() as workdir:
+        settings = config.Config(db_path=os.path.join(workdir, "events.db"))
+        app = website.create_app(settings)
+        with sqlite3.connect(settings.db_path) as db:
+            initdb.init_db(db)
+
+        def plain():
+            return "ok"
+
+        @website.with_token
+        def wrapped():
+            return "ok"
+
+        @website.with_token
+        def wrapped_with_token(token):
+            return "ok"
+
+        app.add_url_rule("/bench/plain", view_func=plain)
+        app.add_url_rule("/bench/wrapped", view_func=wrapped)
+        app.add_url_rule("/bench/token", view_func=wrapped_with_token)
+
+        # one client per view so each keeps its own token cookie
+        baseline = per_request_us(app.test_client(), "/bench/plain", args.n)
+        print(f"{'plain flask view':<28}{baseline:9.1f} us/request")
+        for label, url in [
+            ("with_token", "/bench/wrapped"),
+            ("with_token, token argument", "/bench/token"),
+        ]:
+            us = per_request_us(app.test_client(), url, args.n)
+            print(f"{label:<28}{us:9.1f} us/request  (+{us - baseline:.1f})")
+
+
+def storage(args):
+    sys.path.insert(0, HERE)
+    import sqlite3
+
+    import config
+    import initdb
+    import website
+
+    # the same requests against each engine; the memory engine's time is
+    # all web layer, the difference is what storage costs
+    for engine in ["sqlite", "memory"]:
+        with tempfile.TemporaryDirectory() as workdir:
+            settings = config.Config(storage=engine, db_path=os.path.join(workdir, "events.db"))
+            app = website.create_app(settings)
+            if engine == "sqlite":
+                with sqlite3.connect(settings.db_path) as db:
+                    initdb.init_db(db)
+
+            client = app.test_client()
+            client.post("/api/event", data={"name": "bench", "password": ""})
+            for i in range(args.guests):
+                client.post(
+                    "/api/event/bench/guest",
+                    data={"name": f"guest{i}", "going": "going", "comment": "", "password": ""},
+                )
+
+            print(engine)
+            for label, url in [
+                ("list of events", "/"),
+                ("event page, cached", "/bench"),
+                # any query string skips the page cache
+                ("event page, rendered", "/bench?fresh"),
+            ]:
+                print(f"  {label:<26}{per_request_us(client, url, args.n):9.1f} us/request")
+
+            t0 = time.perf_counter()
+            for i in range(args.n):
+                client.post(
+                    "/api/event/bench/guest/guest0",
+                    data={"going": "going", "comment": str(i)},
+                )
+            us = (time.perf_counter() - t0) / args.n * 1e6
+            print(f"  {'guest update':<26}{us:9.1f} us/request")
+
+
+parser = argparse.ArgumentParser()
+subparsers = parser.add_subparsers(required=True)
+
+startup_parser = subparsers.add_parser("startup", help="import-to-first-response time")
+startup_parser.add_argument("--repeat", type=int, default=5)
+startup_parser.add_argument("--top", type=int, default=10)
+startup_parser.add_argument("--max-import-ms", type=float, default=MAX_IMPORT_MS)
+startup_parser.add_argument("--max-first-request-ms", type=float, default=MAX_FIRST_REQUEST_MS)
+startup_parser.set_defaults(func=startup)
+
+with_token_parser = subparsers.add_parser("with_token", help="per-request overhead of website.with_token")
+with_token_parser.add_argument("-n", type=int, default=2000)
+with_token_parser.set_defaults(func=with_token)
+
+storage_parser = subparsers.add_parser("storage", help="per-request time with each storage engine")
+storage_parser.add_argument("-n", type=int, default=500)
+storage_parser.add_argument("--guests", type=int, default=50)
+storage_parser.set_defaults(func=storage)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    args.func(args)
@@ -0,0 +1,79 @@
+from typing import Any, Callable, Dict, Hashable, List, Optional
+import collections
+import dataclasses
+import threading
+import time
+
+
+@dataclasses.dataclass
+class TTLCache:
+    maxsize: int
+    ttl: Optional[float]  # seconds; None means entries only leave when evicted
+    entries: collections.OrderedDict = dataclasses.field(default_factory=collections.OrderedDict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    generation: int = 0  # bumped whenever entries are invalidated
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            try:
+                expires, value = self.entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                self.misses += 1
+                return default
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, generation: Optional[int] = None) -> None:
+        # pass the generation read before computing value to skip storing it
+        # if something was invalidated in the meantime, as value may be stale
+        expires = None if self.ttl is None else time.monotonic() + self.ttl
+        with self.lock:
+            if generation is not None and generation != self.generation:
+                return
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable) -> None:
+        with self.lock:
+            self.entries.pop(key, None)
+            self.generation += 1
+
+    def pop_where(self, predicate: Callable[[Any], bool]) -> None:
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if predicate(value)]:
+                del self.entries[key]
+            self.generation += 1
+
+    def values(self) -> List[Any]:
+        with self.lock:
+            return [value for _, value in self.entries.values()]
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+            self.generation += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self.entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else None,
+            }
@@ -0,0 +1,106 @@
+from typing import Callable, Dict, List
+import dataclasses
+import sqlite3
+import threading
+
+import config
+
+
+@dataclasses.dataclass
+class Watcher:
+    # triggers record every write in the revision table as a key like
+    # "event:12" with an increasing sequence number; PRAGMA data_version on our
+    # own connection cheaply tells us whether anyone committed since we looked.
+    # With sharding every file has its own revision table, so each is watched.
+    # A worker that missed rows deleted by prune() is told with kind "pruned"
+    listeners: Dict[str, List[Callable[[int], None]]] = dataclasses.field(default_factory=dict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    dbs: Dict[str, sqlite3.Connection] = dataclasses.field(default_factory=dict)
+    data_versions: Dict[str, int] = dataclasses.field(default_factory=dict)
+    seqs: Dict[str, int] = dataclasses.field(default_factory=dict)
+
+    def listen(self, kind: str, callback: Callable[[int], None]) -> None:
+        self.listeners.setdefault(kind, []).append(callback)
+
+    def check(self) -> None:
+        rows = []
+        with self.lock:
+            for path in config.get().db_paths():
+                db = self.dbs.get(path)
+                if db is None:
+                    # nothing is cached yet, so only the current position matters
+                    db = self.dbs[path] = sqlite3.connect(
+                        path,
+                        isolation_level=None,
+                        check_same_thread=False,
+                    )
+                    self.data_versions[path] = db.execute("PRAGMA data_version").fetchone()[0]
+                    self.seqs[path] = db.execute(
+                        "SELECT COALESCE(MAX(revisionseq), 0) FROM revision",
+                    ).fetchone()[0]
+                    continue
+
+                data_version = db.execute("PRAGMA data_version").fetchone()[0]
+                if data_version == self.data_versions[path]:
+                    continue
+                self.data_versions[path] = data_version
+
+                changed = db.execute(
+                    "SELECT revisionkey, revisionseq FROM revision WHERE revisionseq > ?",
+                    (self.seqs[path],),
+                ).fetchall()
+                self.seqs[path] = max([self.seqs[path]] + [seq for _, seq in changed])
+                rows.extend(changed)
+
+        for key, _ in rows:
+            kind, _, id_ = key.partition(":")
+            self.notify(kind, int(id_))
+
+    def notify(self, kind: str, id_: int) -> None:
+        # storage that doesn't go through sqlite tells us about writes directly
+        for callback in self.listeners.get(kind, ()):
+            callback(id_)
+
+    def close(self) -> None:
+        with self.lock:
+            for db in self.dbs.values():
+                db.close()
+            self.dbs.clear()
+            self.data_versions.clear()
+            self.seqs.clear()
+
+
+# stands in for the rows prune() deleted; its seq is the newest one deleted
+PRUNED_KEY = "pruned:0"
+
+
+def prune(db: sqlite3.Connection, keep: int) -> int:
+    # every token ever approved or deleted leaves a row, so keep only the
+    # newest ones; workers that haven't caught up to the deleted rows see
+    # PRUNED_KEY instead and drop everything they cache
+    db.execute("BEGIN IMMEDIATE")
+    try:
+        row = db.execute(
+            "SELECT revisionseq FROM revision WHERE revisionkey != ?"
+            " ORDER BY revisionseq DESC LIMIT 1 OFFSET ?",
+            (PRUNED_KEY, keep),
+        ).fetchone()
+        if row is None:
+            db.rollback()
+            return 0
+
+        cursor = db.execute(
+            "DELETE FROM revision WHERE revisionseq <= ? AND revisionkey != ?", (row[0], PRUNED_KEY),
+        )
+        db.execute(
+            "INSERT OR REPLACE INTO revision (revisionkey, revisionseq) VALUES (?, ?)",
+            (PRUNED_KEY, row[0]),
+        )
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return cursor.rowcount
+
+
+watcher = Watcher()
@@ -0,0 +1,40 @@
+from typing import Optional
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+import cache
+
+
+COMPRESSIBLE = {"text/html", "text/css", "text/plain", "application/json", "application/javascript"}
+MIN_SIZE = 512  # bytes; smaller bodies aren't worth it
+
+# (sha256 of body, encoding) -> compressed body
+compressed = cache.TTLCache(maxsize=512, ttl=None)
+
+
+def choose_encoding(accept_encodings) -> Optional[str]:
+    # accept_encodings is werkzeug's Accept, which maps an encoding to its quality
+    if brotli is not None and accept_encodings["br"]:
+        return "br"
+    if accept_encodings["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    key = (hashlib.sha256(body).digest(), encoding)
+
+    data = compressed.get(key)
+    if data is None:
+        if encoding == "br":
+            data = brotli.compress(body, quality=5)
+        else:
+            data = gzip.compress(body, compresslevel=6, mtime=0)
+        compressed.put(key, data)
+
+    return data
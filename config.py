@@ -0,0 +1,89 @@
+from typing import List, Optional
+import dataclasses
+import functools
+import os
+
+
+@dataclasses.dataclass
+class Config:
+    storage: str = "sqlite"  # or "memory", which keeps nothing on disk (see storage.py)
+    db_path: str = "events.db"
+    # more than one keeps tokens in a directory file next to db_path and
+    # spreads events over that many shard files (see sharding.py)
+    shards: int = 1
+    passhash_path: str = "admin.passhash"
+    salt: bytes = b"mmmmsalty"
+    token_lifetime_days: int = 1
+    auth_cache_size: int = 4096
+    auth_cache_ttl: float = 60  # seconds
+    max_desc_length: int = 100_000  # characters of markdown
+    max_style_length: int = 20_000  # characters of css
+    render_processes: int = 2
+    render_timeout: float = 2  # seconds, after which markdown is shown as plain text
+    issue_rate: float = 1  # new tokens per second per client ip
+    issue_burst: float = 20
+    password_rate: float = 0.1  # password guesses per second per client ip and per target
+    password_burst: float = 10
+    max_in_flight: Optional[int] = 64  # requests; None disables load shedding on this
+    max_latency: Optional[float] = 5  # seconds, recent average; None disables
+    template_cache_dir: Optional[str] = None  # None means jinja's default
+    warm_up: bool = False
+    maintenance: bool = False  # run maintain.Scheduler in the web process
+    maintenance_pages: int = 64  # pages per backup or vacuum step
+    maintenance_sleep: float = 0.05  # seconds between steps
+    backup_dir: Optional[str] = None  # None disables scheduled backups
+    backup_keep: int = 7
+    backup_interval: Optional[float] = 24 * 60 * 60  # seconds; None disables
+    vacuum_interval: Optional[float] = 60 * 60
+    analyze_interval: Optional[float] = 24 * 60 * 60
+    prune_interval: Optional[float] = 60 * 60
+    revision_keep: int = 10_000  # newest rows of the revision table that prune keeps
+
+    @functools.cached_property
+    def admin_passhash(self) -> str:
+        try:
+            with open(self.passhash_path) as f:
+                return f.read().strip()
+        except FileNotFoundError:
+            return ""
+
+    def directory_path(self) -> str:
+        root, ext = os.path.splitext(self.db_path)
+        return f"{root}.directory{ext}"
+
+    def shard_paths(self) -> List[str]:
+        root, ext = os.path.splitext(self.db_path)
+        return [f"{root}.{i}{ext}" for i in range(self.shards)]
+
+    def db_paths(self) -> List[str]:
+        if self.shards > 1:
+            return [self.directory_path()] + self.shard_paths()
+        return [self.db_path]
+
+    @classmethod
+    def from_env(cls) -> "Config":
+        return cls(
+            storage=os.environ.get("EVENT_STORAGE", cls.storage),
+            db_path=os.environ.get("EVENT_DB_PATH", cls.db_path),
+            shards=int(os.environ.get("EVENT_SHARDS", cls.shards)),
+            passhash_path=os.environ.get("EVENT_PASSHASH_PATH", cls.passhash_path),
+            template_cache_dir=os.environ.get("EVENT_TEMPLATE_CACHE_DIR"),
+            warm_up=os.environ.get("EVENT_WARM_UP", "") not in ("", "0"),
+            maintenance=os.environ.get("EVENT_MAINTENANCE", "") not in ("", "0"),
+            backup_dir=os.environ.get("EVENT_BACKUP_DIR"),
+        )
+
+
+_current: Optional[Config] = None
+
+
+def get() -> Config:
+    global _current
+    if _current is None:
+        _current = Config.from_env()
+    return _current
+
+
+def configure(config: Config) -> None:
+    global _current
+    _current = config
@@ -1,7 +1,8 @@
 import getpass
 
+import config
 import model
 
 
 pw = getpass.getpass()
-print(model.hash_password(model.SALT, pw))
\ No newline at end of file
+print(model.hash_password(config.get().salt, pw))
\ No newline at end of file
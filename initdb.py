@@ -1,6 +1,12 @@
+from typing import Dict
 import argparse
-
+import json
+import os
 import sqlite3
+import zlib
+
+import config
+import model
 
 
 DROP = """
@@ -9,6 +15,10 @@ DROP TABLE IF EXISTS guest;
 DROP TABLE IF EXISTS token;
 DROP TABLE IF EXISTS eventtoken;
 DROP TABLE IF EXISTS guesttoken;
+DROP TABLE IF EXISTS eventsearch;
+DROP TABLE IF EXISTS guestsearch;
+DROP TABLE IF EXISTS revision;
+DROP TABLE IF EXISTS archive;
 """
 
 SCRIPT = """
@@ -19,9 +29,15 @@ CREATE TABLE IF NOT EXISTS event (
   eventpasshash TEXT NOT NULL,
   eventtitle TEXT NOT NULL,
   eventstyle TEXT NOT NULL,
-  eventdesc TEXT NOT NULL
+  eventdesc TEXT NOT NULL,
+  eventupdated TEXT NOT NULL DEFAULT '',
+  eventstylehash TEXT NOT NULL DEFAULT ''
 );
 
+CREATE INDEX IF NOT EXISTS eventupdatedindex ON event (eventupdated);
+-- for /style/<hash>.css (see model.style_digest)
+CREATE INDEX IF NOT EXISTS eventstylehashindex ON event (eventstylehash);
+
 CREATE TABLE IF NOT EXISTS guest  (
   guestid INTEGER PRIMARY KEY AUTOINCREMENT,
   guestevent INTEGER NOT NULL,
@@ -31,7 +47,7 @@ CREATE TABLE IF NOT EXISTS guest  (
   guestcomment TEXT NOT NULL,
   guestsalt TEXT NOT NULL,
   guestpasshash TEXT NOT NULL,
-  FOREIGN KEY (guestevent) REFERENCES event(eventid),
+  FOREIGN KEY (guestevent) REFERENCES event(eventid) ON DELETE CASCADE,
   UNIQUE (guestevent, guestname)
 );
 
@@ -47,31 +63,500 @@ CREATE TABLE IF NOT EXISTS eventtoken (
   eventtokenid INTEGER PRIMARY KEY AUTOINCREMENT,
   eventtokenevent INTEGER NOT NULL,
   eventtokentoken INTEGER NOT NULL,
-  FOREIGN KEY (eventtokenevent) REFERENCES event(eventid),
-  FOREIGN KEY (eventtokentoken) REFERENCES token(tokenid)
+  FOREIGN KEY (eventtokenevent) REFERENCES event(eventid) ON DELETE CASCADE,
+  FOREIGN KEY (eventtokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS eventtokeneventindex ON eventtoken (eventtokenevent);
+CREATE INDEX IF NOT EXISTS eventtokentokenindex ON eventtoken (eventtokentoken);
+
+CREATE TABLE IF NOT EXISTS guesttoken (
+  guesttokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  guesttokenguest INTEGER NOT NULL,
+  guesttokentoken INTEGER NOT NULL,
+  FOREIGN KEY (guesttokenguest) REFERENCES guest(guestid) ON DELETE CASCADE,
+  FOREIGN KEY (guesttokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS guesttokenguestindex ON guesttoken (guesttokenguest);
+CREATE INDEX IF NOT EXISTS guesttokentokenindex ON guesttoken (guesttokentoken);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS eventsearch USING fts5 (
+  eventtitle,
+  eventdesc,
+  content='event',
+  content_rowid='eventid'
+);
+
+CREATE TRIGGER IF NOT EXISTS eventsearchinsert AFTER INSERT ON event BEGIN
+  INSERT INTO eventsearch (rowid, eventtitle, eventdesc)
+  VALUES (NEW.eventid, NEW.eventtitle, NEW.eventdesc);
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventsearchdelete AFTER DELETE ON event BEGIN
+  INSERT INTO eventsearch (eventsearch, rowid, eventtitle, eventdesc)
+  VALUES ('delete', OLD.eventid, OLD.eventtitle, OLD.eventdesc);
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventsearchupdate AFTER UPDATE OF eventtitle, eventdesc ON event BEGIN
+  INSERT INTO eventsearch (eventsearch, rowid, eventtitle, eventdesc)
+  VALUES ('delete', OLD.eventid, OLD.eventtitle, OLD.eventdesc);
+  INSERT INTO eventsearch (rowid, eventtitle, eventdesc)
+  VALUES (NEW.eventid, NEW.eventtitle, NEW.eventdesc);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS guestsearch USING fts5 (
+  guesttitle,
+  guestcomment,
+  content='guest',
+  content_rowid='guestid'
+);
+
+CREATE TRIGGER IF NOT EXISTS guestsearchinsert AFTER INSERT ON guest BEGIN
+  INSERT INTO guestsearch (rowid, guesttitle, guestcomment)
+  VALUES (NEW.guestid, NEW.guesttitle, NEW.guestcomment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestsearchdelete AFTER DELETE ON guest BEGIN
+  INSERT INTO guestsearch (guestsearch, rowid, guesttitle, guestcomment)
+  VALUES ('delete', OLD.guestid, OLD.guesttitle, OLD.guestcomment);
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestsearchupdate AFTER UPDATE OF guesttitle, guestcomment ON guest BEGIN
+  INSERT INTO guestsearch (guestsearch, rowid, guesttitle, guestcomment)
+  VALUES ('delete', OLD.guestid, OLD.guesttitle, OLD.guestcomment);
+  INSERT INTO guestsearch (rowid, guesttitle, guestcomment)
+  VALUES (NEW.guestid, NEW.guesttitle, NEW.guestcomment);
+END;
+
+-- eventupdated tracks the last write to an event or its guests, so that
+-- inactive events can be archived
+
+CREATE TRIGGER IF NOT EXISTS eventupdatedinsert AFTER INSERT ON event BEGIN
+  UPDATE event SET eventupdated = CURRENT_TIMESTAMP WHERE eventid = NEW.eventid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventupdatedupdate AFTER UPDATE OF eventtitle, eventstyle, eventdesc ON event BEGIN
+  UPDATE event SET eventupdated = CURRENT_TIMESTAMP WHERE eventid = NEW.eventid;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestupdatedinsert AFTER INSERT ON guest BEGIN
+  UPDATE event SET eventupdated = CURRENT_TIMESTAMP WHERE eventid = NEW.guestevent;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestupdatedupdate AFTER UPDATE ON guest BEGIN
+  UPDATE event SET eventupdated = CURRENT_TIMESTAMP WHERE eventid = NEW.guestevent;
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestupdateddelete AFTER DELETE ON guest BEGIN
+  UPDATE event SET eventupdated = CURRENT_TIMESTAMP WHERE eventid = OLD.guestevent;
+END;
+
+-- archived events, one zlib-compressed json blob each (see model.Archive);
+-- archiveid is the id the event had, and gets back when restored
+
+CREATE TABLE IF NOT EXISTS archive (
+  archiveid INTEGER PRIMARY KEY,
+  archivename TEXT UNIQUE NOT NULL,
+  archiveupdated TEXT NOT NULL,
+  archivedata BLOB NOT NULL,
+  archivestylehash TEXT NOT NULL DEFAULT ''
+);
+
+CREATE INDEX IF NOT EXISTS archivestylehashindex ON archive (archivestylehash);
+
+-- every write bumps a revision key so other workers know what to drop from
+-- their caches (see coherence.py); token expiry refreshes don't count
+
+CREATE TABLE IF NOT EXISTS revision (
+  revisionkey TEXT PRIMARY KEY NOT NULL,
+  revisionseq INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS revisionseqindex ON revision (revisionseq);
+
+CREATE TRIGGER IF NOT EXISTS eventrevisioninsert AFTER INSERT ON event BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || NEW.eventid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventrevisionupdate AFTER UPDATE ON event BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || NEW.eventid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventrevisiondelete AFTER DELETE ON event BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || OLD.eventid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestrevisioninsert AFTER INSERT ON guest BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || NEW.guestevent, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestrevisionupdate AFTER UPDATE ON guest BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || NEW.guestevent, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guestrevisiondelete AFTER DELETE ON guest BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || OLD.guestevent, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS tokenrevisionupdate AFTER UPDATE OF tokenadmin ON token BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.tokenid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS tokenrevisiondelete AFTER DELETE ON token BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.tokenid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventtokenrevisioninsert AFTER INSERT ON eventtoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.eventtokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventtokenrevisiondelete AFTER DELETE ON eventtoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.eventtokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesttokenrevisioninsert AFTER INSERT ON guesttoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.guesttokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesttokenrevisiondelete AFTER DELETE ON guesttoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.guesttokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS archiverevisiondelete AFTER DELETE ON archive BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('event:' || OLD.archiveid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+"""
+
+DROP_DIRECTORY = """
+DROP TABLE IF EXISTS token;
+DROP TABLE IF EXISTS eventtoken;
+DROP TABLE IF EXISTS guesttoken;
+DROP TABLE IF EXISTS eventindex;
+DROP TABLE IF EXISTS revision;
+"""
+
+# with sharding (see sharding.py), tokens and approvals live in a directory
+# file and events and guests in shard files made with SCRIPT; approvals can't
+# reference events and guests in other files, so deletes clean them up instead
+DIRECTORY_SCRIPT = """
+CREATE TABLE IF NOT EXISTS token (
+  tokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  tokenname TEXT NOT NULL,
+  tokenadmin BOOLEAN NOT NULL,
+  tokenexpires TEXT NOT NULL,
+  UNIQUE (tokenname)
+);
+
+CREATE TABLE IF NOT EXISTS eventtoken (
+  eventtokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  eventtokenevent INTEGER NOT NULL,
+  eventtokentoken INTEGER NOT NULL,
+  FOREIGN KEY (eventtokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
 );
 
+CREATE INDEX IF NOT EXISTS eventtokeneventindex ON eventtoken (eventtokenevent);
+CREATE INDEX IF NOT EXISTS eventtokentokenindex ON eventtoken (eventtokentoken);
+
 CREATE TABLE IF NOT EXISTS guesttoken (
   guesttokenid INTEGER PRIMARY KEY AUTOINCREMENT,
   guesttokenguest INTEGER NOT NULL,
   guesttokentoken INTEGER NOT NULL,
-  FOREIGN KEY (guesttokenguest) REFERENCES guest(guestid),
-  FOREIGN KEY (guesttokentoken) REFERENCES token(tokenid)
+  FOREIGN KEY (guesttokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS guesttokenguestindex ON guesttoken (guesttokenguest);
+CREATE INDEX IF NOT EXISTS guesttokentokenindex ON guesttoken (guesttokentoken);
+
+-- which shard each event (live or archived) is in; eventindexid hands out
+-- event ids, so they stay unique across shards
+
+CREATE TABLE IF NOT EXISTS eventindex (
+  eventindexid INTEGER PRIMARY KEY AUTOINCREMENT,
+  eventindexname TEXT UNIQUE NOT NULL,
+  eventindexshard INTEGER NOT NULL
 );
+
+CREATE TABLE IF NOT EXISTS revision (
+  revisionkey TEXT PRIMARY KEY NOT NULL,
+  revisionseq INTEGER NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS revisionseqindex ON revision (revisionseq);
+
+CREATE TRIGGER IF NOT EXISTS tokenrevisionupdate AFTER UPDATE OF tokenadmin ON token BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.tokenid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS tokenrevisiondelete AFTER DELETE ON token BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.tokenid, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventtokenrevisioninsert AFTER INSERT ON eventtoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.eventtokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS eventtokenrevisiondelete AFTER DELETE ON eventtoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.eventtokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesttokenrevisioninsert AFTER INSERT ON guesttoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || NEW.guesttokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+
+CREATE TRIGGER IF NOT EXISTS guesttokenrevisiondelete AFTER DELETE ON guesttoken BEGIN
+  INSERT OR REPLACE INTO revision (revisionkey, revisionseq)
+  VALUES ('token:' || OLD.guesttokentoken, (SELECT COALESCE(MAX(revisionseq), 0) + 1 FROM revision));
+END;
+"""
+
+# MIGRATIONS[i] takes a database from user_version i to i + 1. They run with
+# foreign keys off; SCRIPT runs afterwards to recreate triggers and indexes
+# dropped along with rebuilt tables.
+MIGRATIONS = [
+    # add ON DELETE CASCADE; sqlite can only do that by rebuilding the table,
+    # and the sqlite_sequence shuffle stops AUTOINCREMENT from reusing ids
+    """
+    CREATE TABLE guestnew (
+      guestid INTEGER PRIMARY KEY AUTOINCREMENT,
+      guestevent INTEGER NOT NULL,
+      guestname TEXT NOT NULL,
+      guesttitle TEXT NOT NULL,
+      guestgoing BOOLEAN NOT NULL,
+      guestcomment TEXT NOT NULL,
+      guestsalt TEXT NOT NULL,
+      guestpasshash TEXT NOT NULL,
+      FOREIGN KEY (guestevent) REFERENCES event(eventid) ON DELETE CASCADE,
+      UNIQUE (guestevent, guestname)
+    );
+    INSERT INTO guestnew SELECT
+      guestid, guestevent, guestname, guesttitle, guestgoing, guestcomment, guestsalt, guestpasshash
+    FROM guest;
+    DELETE FROM sqlite_sequence WHERE name = 'guestnew';
+    UPDATE sqlite_sequence SET name = 'guestnew' WHERE name = 'guest';
+    DROP TABLE guest;
+    ALTER TABLE guestnew RENAME TO guest;
+
+    CREATE TABLE eventtokennew (
+      eventtokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+      eventtokenevent INTEGER NOT NULL,
+      eventtokentoken INTEGER NOT NULL,
+      FOREIGN KEY (eventtokenevent) REFERENCES event(eventid) ON DELETE CASCADE,
+      FOREIGN KEY (eventtokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
+    );
+    INSERT INTO eventtokennew SELECT
+      eventtokenid, eventtokenevent, eventtokentoken
+    FROM eventtoken;
+    DELETE FROM sqlite_sequence WHERE name = 'eventtokennew';
+    UPDATE sqlite_sequence SET name = 'eventtokennew' WHERE name = 'eventtoken';
+    DROP TABLE eventtoken;
+    ALTER TABLE eventtokennew RENAME TO eventtoken;
+
+    CREATE TABLE guesttokennew (
+      guesttokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+      guesttokenguest INTEGER NOT NULL,
+      guesttokentoken INTEGER NOT NULL,
+      FOREIGN KEY (guesttokenguest) REFERENCES guest(guestid) ON DELETE CASCADE,
+      FOREIGN KEY (guesttokentoken) REFERENCES token(tokenid) ON DELETE CASCADE
+    );
+    INSERT INTO guesttokennew SELECT
+      guesttokenid, guesttokenguest, guesttokentoken
+    FROM guesttoken;
+    DELETE FROM sqlite_sequence WHERE name = 'guesttokennew';
+    UPDATE sqlite_sequence SET name = 'guesttokennew' WHERE name = 'guesttoken';
+    DROP TABLE guesttoken;
+    ALTER TABLE guesttokennew RENAME TO guesttoken;
+    """,
+    # track last write time, for archiving; existing events count from now
+    """
+    ALTER TABLE event ADD COLUMN eventupdated TEXT NOT NULL DEFAULT '';
+    UPDATE event SET eventupdated = CURRENT_TIMESTAMP;
+    """,
+    # look styles up by content hash; init_db fills it in
+    """
+    ALTER TABLE event ADD COLUMN eventstylehash TEXT NOT NULL DEFAULT '';
+    """,
+    # archived events' pages link their styles too. Files from before
+    # archiving have no archive table yet; make it as it was, then add to it
+    """
+    CREATE TABLE IF NOT EXISTS archive (
+      archiveid INTEGER PRIMARY KEY,
+      archivename TEXT UNIQUE NOT NULL,
+      archiveupdated TEXT NOT NULL,
+      archivedata BLOB NOT NULL
+    );
+    ALTER TABLE archive ADD COLUMN archivestylehash TEXT NOT NULL DEFAULT '';
+    """,
+]
+
+# rows left behind by deletes from before foreign keys were enforced;
+# guests go first so that their guesttoken rows are swept too. They run with
+# foreign keys off so that each table's count includes no cascaded rows
+ORPHANS = {
+    "guest": "DELETE FROM guest WHERE guestevent NOT IN (SELECT eventid FROM event)",
+    "eventtoken": (
+        "DELETE FROM eventtoken"
+        " WHERE eventtokenevent NOT IN (SELECT eventid FROM event)"
+        " OR eventtokentoken NOT IN (SELECT tokenid FROM token)"
+    ),
+    "guesttoken": (
+        "DELETE FROM guesttoken"
+        " WHERE guesttokenguest NOT IN (SELECT guestid FROM guest)"
+        " OR guesttokentoken NOT IN (SELECT tokenid FROM token)"
+    ),
+}
+
+# index rows that predate the search tables
+REBUILD_SEARCH = """
+INSERT INTO eventsearch (eventsearch) VALUES ('rebuild');
+INSERT INTO guestsearch (guestsearch) VALUES ('rebuild');
 """
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument("--reset", action="store_true")
-args = parser.parse_args()
+def migrate(db: sqlite3.Connection) -> None:
+    version = db.execute("PRAGMA user_version").fetchone()[0]
+
+    for version, script in enumerate(MIGRATIONS[version:], start=version + 1):
+        db.execute("PRAGMA foreign_keys = OFF")
+        db.executescript(f"BEGIN; {script}; PRAGMA user_version = {version}; COMMIT;")
+
+    db.execute("PRAGMA foreign_keys = ON")
+
+
+def init_db(db: sqlite3.Connection, reset: bool = False) -> None:
+    if reset:
+        db.executescript(DROP)
+
+    cursor = db.execute("SELECT * FROM sqlite_master WHERE type = 'table' AND name = 'event'")
+    if cursor.fetchone() is None:
+        # only takes effect before anything is written to the file
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        # SCRIPT already creates the latest schema
+        db.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+    else:
+        migrate(db)
+
+    # readers (requests, and backups in maintain.py) then work from a
+    # snapshot instead of blocking writers; the mode is kept in the file
+    db.execute("PRAGMA journal_mode = WAL")
+
+    db.executescript(SCRIPT)
+    db.executescript(REBUILD_SEARCH)
+
+    with db:
+        fill_style_hashes(db)
+
+
+def fill_style_hashes(db: sqlite3.Connection) -> None:
+    # sqlite has no sha256, so hashes of styles from before the columns
+    # existed (or copied from files that predate them) are filled in here
+    db.create_function("styledigest", 1, model.style_digest, deterministic=True)
+    db.execute("UPDATE event SET eventstylehash = styledigest(eventstyle) WHERE eventstylehash = ''")
+
+    rows = db.execute("SELECT archiveid, archivedata FROM archive WHERE archivestylehash = ''").fetchall()
+    for archive_id, data in rows:
+        style = json.loads(zlib.decompress(data))["event"]["style"]
+        db.execute(
+            "UPDATE archive SET archivestylehash = ? WHERE archiveid = ?",
+            (model.style_digest(style), archive_id),
+        )
+
+
+def init_directory(db: sqlite3.Connection, reset: bool = False) -> None:
+    if reset:
+        db.executescript(DROP_DIRECTORY)
+
+    cursor = db.execute("SELECT * FROM sqlite_master WHERE type = 'table' AND name = 'token'")
+    if cursor.fetchone() is None:
+        db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
+    db.execute("PRAGMA journal_mode = WAL")
+    db.executescript(DIRECTORY_SCRIPT)
+
+
+def db_size(db: sqlite3.Connection) -> int:
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    page_count = db.execute("PRAGMA page_count").fetchone()[0]
+    return page_size * page_count
+
+
+def sweep_orphans(db: sqlite3.Connection, orphans: Dict[str, str] = ORPHANS) -> None:
+    db.execute("PRAGMA foreign_keys = OFF")
+    try:
+        with db:
+            for table, sql in orphans.items():
+                print(f"{table}: deleted {db.execute(sql).rowcount} orphaned rows")
+    finally:
+        db.execute("PRAGMA foreign_keys = ON")
+
+    page_size = db.execute("PRAGMA page_size").fetchone()[0]
+    free_pages = db.execute("PRAGMA freelist_count").fetchone()[0]
+    switching = db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2
+    before = db_size(db)
+
+    # the full vacuum is also what switches an existing database over to
+    # incremental vacuum, which maintain.py then does a few pages at a time
+    db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+    db.execute("VACUUM")
+    print(f"reclaimed {free_pages} free pages ({free_pages * page_size} bytes)")
+    if switching:
+        # incremental vacuum needs pointer-map pages, so the file can grow
+        print(f"turned on incremental vacuum; file went from {before} to {db_size(db)} bytes")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reset", action="store_true")
+    parser.add_argument(
+        "--sweep", action="store_true",
+        help="delete rows orphaned by deletes from before foreign keys were enforced",
+    )
+    args = parser.parse_args()
+
+    if config.get().shards > 1:
+        directory = sqlite3.connect(config.get().directory_path())
+        directory.execute("PRAGMA foreign_keys = ON")
+        init_directory(directory, reset=args.reset)
+        if args.sweep:
+            # approvals go with their tokens by cascade, and with their events
+            # and guests in model, so there's nothing to sweep but free pages
+            sweep_orphans(directory, orphans={})
+        paths = config.get().shard_paths()
+        if os.path.exists(config.get().db_path):
+            # events sharding.py hasn't moved yet; it needs them migrated
+            paths.append(config.get().db_path)
+    else:
+        paths = [config.get().db_path]
 
+    for path in paths:
+        db = sqlite3.connect(
+            path,
+            detect_types=sqlite3.PARSE_DECLTYPES,
+        )
+        db.execute("PRAGMA foreign_keys = ON")
+        init_db(db, reset=args.reset)
 
-db = sqlite3.connect(
-    "events.db",
-    detect_types=sqlite3.PARSE_DECLTYPES,
-)
+        if args.sweep:
+            sweep_orphans(db)
 
-if args.reset:
-  db.executescript(DROP)
 
-db.executescript(SCRIPT)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+from typing import Callable, Dict, Optional
+import argparse
+import dataclasses
+import datetime
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import coherence
+import config
+import initdb
+
+
+logger = logging.getLogger(__name__)
+
+
+@dataclasses.dataclass
+class Throttle:
+    # every step holds a lock on the database only briefly; in between we
+    # sleep, and keep sleeping while the site is busy, up to max_wait
+    sleep: float  # seconds
+    busy: Callable[[], bool] = lambda: False
+    max_wait: float = 10  # seconds
+
+    def pause(self) -> None:
+        deadline = time.monotonic() + self.max_wait
+        time.sleep(self.sleep)
+        while self.busy() and time.monotonic() < deadline:
+            time.sleep(self.sleep)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA foreign_keys = ON")
+    return db
+
+
+class _Restarted(Exception):
+    pass
+
+
+def backup(db: sqlite3.Connection, path: str, throttle: Throttle, pages: int, max_restarts: int = 3) -> None:
+    # copies a consistent snapshot a few pages at a time while requests carry
+    # on; a write from another connection mid-copy makes sqlite start over.
+    # If that keeps happening, a wal database is copied in one go, which
+    # reads a snapshot without blocking writers. Any other would hold its
+    # lock through the copy, so the backup fails and is tried again later
+    remaining_before = None
+    restarts = 0
+
+    def progress(status, remaining, total):
+        nonlocal remaining_before, restarts
+        if remaining_before is not None and remaining > remaining_before:
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarted
+        remaining_before = remaining
+        throttle.pause()
+
+    tmp = path + ".tmp"
+    target = sqlite3.connect(tmp)
+    try:
+        try:
+            db.backup(target, pages=pages, progress=progress, sleep=throttle.sleep)
+        except _Restarted:
+            if db.execute("PRAGMA journal_mode").fetchone()[0] != "wal":
+                raise sqlite3.OperationalError(
+                    "backup kept being restarted by writes; run initdb.py to switch to wal",
+                )
+            db.backup(target, pages=-1, sleep=throttle.sleep)
+    except BaseException:
+        target.close()
+        os.remove(tmp)
+        raise
+    target.close()
+    os.replace(tmp, path)
+
+
+def backup_to_dir(
+    db: sqlite3.Connection, db_path: str, directory: str, keep: int, throttle: Throttle, pages: int,
+) -> str:
+    os.makedirs(directory, exist_ok=True)
+    root, ext = os.path.splitext(os.path.basename(db_path))
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, f"{root}-{stamp}{ext}")
+    backup(db, path, throttle, pages)
+
+    for old in sorted(glob.glob(os.path.join(directory, f"{root}-*{ext}")))[:-keep]:
+        os.remove(old)
+
+    return path
+
+
+def vacuum(db: sqlite3.Connection, throttle: Throttle, pages: int) -> int:
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+        raise ValueError("incremental vacuum is off; run initdb.py --sweep once to turn it on")
+
+    before = initdb.db_size(db)
+    while db.execute("PRAGMA freelist_count").fetchone()[0]:
+        # the pragma only frees pages as its result rows are stepped through
+        db.execute(f"PRAGMA incremental_vacuum({pages})").fetchall()
+        throttle.pause()
+    return before - initdb.db_size(db)
+
+
+def analyze(db: sqlite3.Connection) -> None:
+    # analysis_limit samples each index instead of reading all of it
+    db.execute("PRAGMA analysis_limit = 1000")
+    db.execute("ANALYZE")
+    db.execute("PRAGMA optimize")
+
+
+@dataclasses.dataclass
+class Scheduler:
+    throttle: Throttle
+    stopped: threading.Event = dataclasses.field(default_factory=threading.Event)
+    thread: Optional[threading.Thread] = None
+
+    def jobs(self) -> Dict[str, float]:
+        settings = config.get()
+        jobs = {
+            "vacuum": settings.vacuum_interval,
+            "analyze": settings.analyze_interval,
+            "prune": settings.prune_interval,
+        }
+        if settings.backup_dir is not None:
+            jobs["backup"] = settings.backup_interval
+        return {name: interval for name, interval in jobs.items() if interval is not None}
+
+    def run_job(self, db: sqlite3.Connection, path: str, name: str) -> None:
+        settings = config.get()
+        if name == "backup":
+            backup_to_dir(
+                db, path, settings.backup_dir, settings.backup_keep, self.throttle, settings.maintenance_pages,
+            )
+        elif name == "vacuum":
+            vacuum(db, self.throttle, settings.maintenance_pages)
+        elif name == "analyze":
+            analyze(db)
+        elif name == "prune":
+            coherence.prune(db, settings.revision_keep)
+
+    def run(self) -> None:
+        jobs = self.jobs()
+        # nothing runs at startup, so restarting workers don't pile up work
+        due = {name: time.monotonic() + interval for name, interval in jobs.items()}
+
+        # with sharding, backups of different files aren't taken at one instant
+        dbs = {path: connect(path) for path in config.get().db_paths()}
+        try:
+            while not self.stopped.wait(1):
+                for name, interval in jobs.items():
+                    if time.monotonic() < due[name]:
+                        continue
+                    for path, db in dbs.items():
+                        try:
+                            self.run_job(db, path, name)
+                        except (sqlite3.Error, OSError, ValueError):
+                            logger.exception("maintenance job %s failed on %s", name, path)
+                    due[name] = time.monotonic() + interval
+        finally:
+            for db in dbs.values():
+                db.close()
+
+    def start(self) -> None:
+        self.thread = threading.Thread(target=self.run, name="maintenance", daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    backup_parser = subparsers.add_parser("backup", help="copy the database while the site runs")
+    backup_parser.add_argument("path", nargs="?", help="file to write, or omit to rotate in backup_dir")
+    subparsers.add_parser("vacuum", help="return free pages to the filesystem a few at a time")
+    subparsers.add_parser("analyze", help="refresh the query planner's statistics")
+    subparsers.add_parser("prune", help="forget all but the newest rows of the revision table")
+    subparsers.add_parser("run", help="run the maintenance schedule until interrupted")
+    args = parser.parse_args()
+
+    settings = config.get()
+    throttle = Throttle(sleep=settings.maintenance_sleep)
+
+    if args.command == "backup":
+        if args.path is not None:
+            if settings.shards > 1:
+                parser.error("with more than one shard, set EVENT_BACKUP_DIR instead")
+            backup(connect(settings.db_path), args.path, throttle, settings.maintenance_pages)
+            print(f"backed up to {args.path}")
+        elif settings.backup_dir is not None:
+            for db_path in settings.db_paths():
+                path = backup_to_dir(
+                    connect(db_path), db_path, settings.backup_dir, settings.backup_keep,
+                    throttle, settings.maintenance_pages,
+                )
+                print(f"backed up to {path}")
+        else:
+            parser.error("give a path or set EVENT_BACKUP_DIR")
+    elif args.command == "vacuum":
+        for db_path in settings.db_paths():
+            try:
+                print(f"{db_path}: reclaimed {vacuum(connect(db_path), throttle, settings.maintenance_pages)} bytes")
+            except ValueError as e:
+                parser.error(str(e))
+    elif args.command == "analyze":
+        for db_path in settings.db_paths():
+            analyze(connect(db_path))
+        print("analyzed")
+    elif args.command == "prune":
+        for db_path in settings.db_paths():
+            print(f"{db_path}: deleted {coherence.prune(connect(db_path), settings.revision_keep)} revision rows")
+    elif args.command == "run":
+        try:
+            Scheduler(throttle).run()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
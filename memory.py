@@ -0,0 +1,440 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import dataclasses
+import datetime
+import functools
+import itertools
+import re
+import secrets
+import threading
+
+import coherence
+import config
+import model
+import pubsub
+
+
+# Storage that lives in dicts in this process and is gone when it exits:
+# for demos, and for timing the web layer without any disk i/o. Every
+# worker process has its own, so run a single worker.
+
+
+@dataclasses.dataclass
+class Store:
+    lock: threading.RLock = dataclasses.field(default_factory=threading.RLock)
+    ids: Iterator[int] = dataclasses.field(default_factory=lambda: itertools.count(1))
+    events: Dict[int, model.Event] = dataclasses.field(default_factory=dict)
+    event_ids: Dict[str, int] = dataclasses.field(default_factory=dict)  # by name
+    guests: Dict[int, model.Guest] = dataclasses.field(default_factory=dict)
+    guest_ids: Dict[int, Dict[str, int]] = dataclasses.field(default_factory=dict)  # by event id, then name
+    tokens: Dict[int, model.Token] = dataclasses.field(default_factory=dict)
+    token_ids: Dict[str, int] = dataclasses.field(default_factory=dict)  # by name
+    event_approvals: Dict[int, Set[int]] = dataclasses.field(default_factory=dict)  # token id -> event ids
+    guest_approvals: Dict[int, Set[int]] = dataclasses.field(default_factory=dict)  # token id -> guest ids
+    archive: Dict[str, model.ArchivedEvent] = dataclasses.field(default_factory=dict)  # by name
+    style_names: Dict[str, Set[str]] = dataclasses.field(default_factory=dict)  # by style digest; archived too
+
+
+store = Store()
+
+
+def with_lock(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.store.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+def now() -> str:
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def search_terms(query: str) -> List[str]:
+    # like model.search_query: every term must prefix-match some word
+    query = "".join(c if c.isprintable() else " " for c in query)
+    return [term.lower() for term in query.split()]
+
+
+def word_matches(word: str, terms: List[str]) -> bool:
+    word = word.lower()
+    return any(word.startswith(term) for term in terms)
+
+
+def match(terms: List[str], *fields: Tuple[str, float]) -> Optional[Tuple[float, str]]:
+    # returns (rank, snippet) like fts5's bm25 and snippet, only cruder:
+    # rank counts matching words, weighted by field; lower is better
+    words = [(re.findall(r"\w+", text), weight, text) for text, weight in fields]
+    for term in terms:
+        if not any(word.lower().startswith(term) for field_words, _, _ in words for word in field_words):
+            return None
+
+    rank = -sum(
+        weight * sum(word_matches(word, terms) for word in field_words)
+        for field_words, weight, _ in words
+    )
+
+    # the snippet is up to 16 words of the first field with a match
+    for _, _, text in words:
+        # words are at the odd indexes, the text between them at the even ones
+        pieces = re.split(r"(\w+)", text)
+        hits = [i for i, piece in enumerate(pieces) if i % 2 and word_matches(piece, terms)]
+        if not hits:
+            continue
+        start = max(0, hits[0] - 16)
+        end = start + 32
+        snippet = "".join(
+            model.MATCH_START + piece + model.MATCH_END if i % 2 and word_matches(piece, terms) else piece
+            for i, piece in enumerate(pieces[start:end], start)
+        )
+        return rank, ("..." if start else "") + snippet.strip() + ("..." if end < len(pieces) else "")
+
+    return rank, ""
+
+
+@dataclasses.dataclass
+class Guests:
+    store: Store
+
+    @with_lock
+    def get(self, event_id: int, name: str) -> model.Guest:
+        try:
+            return self.store.guests[self.store.guest_ids[event_id][name]]
+        except KeyError:
+            raise LookupError(f"no guest with name {name} for event {event_id}")
+
+    @with_lock
+    def get_all(self, event_id: int) -> List[model.Guest]:
+        ids = self.store.guest_ids.get(event_id, {}).values()
+        return sorted((self.store.guests[id_] for id_ in ids), key=lambda guest: guest.id)
+
+    @with_lock
+    def search(
+        self, event_id: int, query: str, limit: int = 20, offset: int = 0,
+    ) -> List[model.GuestMatch]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        matches = []
+        for guest in self.get_all(event_id):
+            found = match(terms, (guest.title, 10.0), (guest.comment, 1.0))
+            if found is not None:
+                rank, snippet = found
+                matches.append((rank, model.GuestMatch(guest=guest, snippet=snippet)))
+
+        matches.sort(key=lambda pair: pair[0])
+        return [guest_match for _, guest_match in matches[offset:offset + limit]]
+
+    @with_lock
+    def create(
+        self, event_id: int, name: str, title: str, password: str, going: bool, comment: str,
+    ) -> None:
+        try:
+            self.get(event_id, name)
+        except LookupError:
+            if event_id not in self.store.events:
+                raise LookupError(f"no event with id {event_id}")
+
+            salt = secrets.token_bytes(4)
+            guest = model.Guest(
+                id=next(self.store.ids),
+                event=event_id,
+                name=name,
+                title=title,
+                going=going,
+                comment=comment,
+                salt=salt,
+                passhash=model.hash_password(salt, password),
+            )
+            self.store.guests[guest.id] = guest
+            self.store.guest_ids.setdefault(event_id, {})[name] = guest.id
+            Events(self.store).touch(event_id)
+            pubsub.broker.publish(model.guest_topic(event_id), model.guest_change("create", guest))
+        else:
+            raise model.AlreadyExistsError(f"guest {name} of event {event_id} already exists")
+
+    @with_lock
+    def approve_token(self, event_id: int, name: str, token: model.Token, password: str) -> None:
+        guest = self.get(event_id, name)
+
+        if model.hash_password(guest.salt, password) == guest.passhash:
+            Tokens(self.store).approve(token, guest_ids=[guest.id])
+        else:
+            raise PermissionError(f"bad password for guest {guest!r}")
+
+    @with_lock
+    def check_token(self, event_id: int, name: str, token: model.Token) -> bool:
+        guest = self.get(event_id, name)
+
+        try:
+            approved = guest.id in Tokens(self.store).grants(token.name).guests
+        except LookupError:
+            approved = False
+        return approved or token.admin
+
+    @with_lock
+    def update(self, event_id: int, name: str, going: bool, comment: str) -> None:
+        guest = dataclasses.replace(self.get(event_id, name), going=going, comment=comment)
+        self.store.guests[guest.id] = guest
+        Events(self.store).touch(event_id)
+        pubsub.broker.publish(model.guest_topic(event_id), model.guest_change("update", guest))
+
+    @with_lock
+    def delete(self, event_id: int, name: str) -> None:
+        guest = self.get(event_id, name)
+
+        del self.store.guests[guest.id]
+        del self.store.guest_ids[event_id][name]
+        Tokens(self.store).drop_approvals(guest_ids=[guest.id])
+        Events(self.store).touch(event_id)
+        pubsub.broker.publish(model.guest_topic(event_id), model.guest_change("delete", guest))
+
+
+@dataclasses.dataclass
+class Events:
+    store: Store
+
+    def touch(self, event_id: int) -> None:
+        # what the eventupdated and revision triggers do for sqlite
+        event = self.store.events[event_id]
+        self.store.events[event_id] = dataclasses.replace(event, updated=now())
+        coherence.watcher.notify("event", event_id)
+
+    def index_style(self, event: model.Event) -> None:
+        self.store.style_names.setdefault(model.style_digest(event.style), set()).add(event.name)
+
+    def unindex_style(self, event: model.Event) -> None:
+        digest = model.style_digest(event.style)
+        names = self.store.style_names.get(digest, set())
+        names.discard(event.name)
+        if not names:
+            self.store.style_names.pop(digest, None)
+
+    @with_lock
+    def get(self, name: str) -> model.Event:
+        try:
+            return self.store.events[self.store.event_ids[name]]
+        except KeyError:
+            # raises LookupError if it isn't archived either
+            return Archive(self.store).get(name)
+
+    def get_live(self, name: str) -> model.Event:
+        event = self.get(name)
+        if isinstance(event, model.ArchivedEvent):
+            raise model.ArchivedError(f"event {name} is archived")
+        return event
+
+    @with_lock
+    def get_all(self) -> List[model.Event]:
+        return sorted(self.store.events.values(), key=lambda event: event.id)
+
+    @with_lock
+    def get_style(self, digest: str) -> str:
+        try:
+            name = next(iter(self.store.style_names[digest]))
+        except KeyError:
+            raise LookupError(f"no style with hash {digest}")
+        return self.get(name).style
+
+    @with_lock
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[model.EventMatch]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+
+        matches = []
+        for event in self.get_all():
+            found = match(terms, (event.title, 10.0), (event.desc, 1.0))
+            if found is not None:
+                rank, snippet = found
+                matches.append(model.EventMatch(event=event, snippet=snippet, rank=rank))
+
+        matches.sort(key=lambda event_match: event_match.rank)
+        return matches[offset:offset + limit]
+
+    @with_lock
+    def create(self, name: str, password: str, style: str, title: str, desc: str) -> None:
+        model.check_event_size(style, desc)
+
+        try:
+            self.get(name)
+        except LookupError:
+            salt = secrets.token_bytes(4)
+            event = model.Event(
+                id=next(self.store.ids),
+                name=name,
+                title=title,
+                style=style,
+                desc=desc,
+                salt=salt,
+                passhash=model.hash_password(salt, password),
+                updated=now(),
+            )
+            self.store.events[event.id] = event
+            self.store.event_ids[name] = event.id
+            self.index_style(event)
+        else:
+            raise model.AlreadyExistsError
+
+    @with_lock
+    def approve_token(self, name: str, token: model.Token, password: str) -> None:
+        event = self.get_live(name)
+
+        if model.hash_password(event.salt, password) == event.passhash:
+            Tokens(self.store).approve(token, event_ids=[event.id])
+        else:
+            raise PermissionError(f"bad password for event {event!r}")
+
+    @with_lock
+    def check_token(self, name: str, token: model.Token) -> bool:
+        event = self.get(name)
+
+        try:
+            approved = event.id in Tokens(self.store).grants(token.name).events
+        except LookupError:
+            approved = False
+        return approved or token.admin
+
+    @with_lock
+    def update(self, name: str, style: str, title: str, desc: str) -> None:
+        event = self.get_live(name)
+        model.check_event_size(style, desc)
+
+        self.unindex_style(event)
+        self.store.events[event.id] = dataclasses.replace(event, style=style, title=title, desc=desc)
+        self.index_style(self.store.events[event.id])
+        self.touch(event.id)
+
+    @with_lock
+    def delete(self, name: str) -> None:
+        event = self.get(name)
+
+        if isinstance(event, model.ArchivedEvent):
+            del self.store.archive[name]
+            self.unindex_style(event)
+            coherence.watcher.notify("event", event.id)
+            return
+
+        guest_ids = list(self.store.guest_ids.pop(event.id, {}).values())
+        for guest_id in guest_ids:
+            del self.store.guests[guest_id]
+        del self.store.events[event.id]
+        del self.store.event_ids[name]
+        self.unindex_style(event)
+        Tokens(self.store).drop_approvals(event_ids=[event.id], guest_ids=guest_ids)
+        coherence.watcher.notify("event", event.id)
+
+
+@dataclasses.dataclass
+class Tokens:
+    store: Store
+
+    def get(self, name: str) -> model.Token:
+        return self.grants(name).token
+
+    @with_lock
+    def grants(self, name: str) -> model.Grants:
+        # no auth_cache here: this already is a lookup in a dict
+        try:
+            token = self.store.tokens[self.store.token_ids[name]]
+        except KeyError:
+            raise LookupError(f"no token with name {name}")
+
+        return model.Grants(
+            token=token,
+            events=set(self.store.event_approvals.get(token.id, ())),
+            guests=set(self.store.guest_approvals.get(token.id, ())),
+        )
+
+    @with_lock
+    def create(self, name: str) -> None:
+        expires = datetime.datetime.now() + datetime.timedelta(days=config.get().token_lifetime_days)
+
+        if name in self.store.token_ids:
+            raise model.AlreadyExistsError
+
+        token = model.Token(id=next(self.store.ids), name=name, admin=False, expires=expires)
+        self.store.tokens[token.id] = token
+        self.store.token_ids[name] = token.id
+
+    @with_lock
+    def refresh(self, name: str) -> None:
+        expires = datetime.datetime.now() + datetime.timedelta(days=config.get().token_lifetime_days)
+
+        token = self.get(name)
+        self.store.tokens[token.id] = dataclasses.replace(token, expires=expires)
+
+    @with_lock
+    def set_admin(self, name: str, password: str) -> None:
+        token = self.get(name)
+
+        passhash = model.hash_password(config.get().salt, password)
+        if passhash == config.get().admin_passhash:
+            self.store.tokens[token.id] = dataclasses.replace(token, admin=True)
+        else:
+            raise PermissionError(f"bad admin password")
+
+    @with_lock
+    def approve(
+        self, token: model.Token, event_ids: Iterable[int] = (), guest_ids: Iterable[int] = (),
+    ) -> None:
+        self.store.event_approvals.setdefault(token.id, set()).update(event_ids)
+        self.store.guest_approvals.setdefault(token.id, set()).update(guest_ids)
+
+    @with_lock
+    def drop_approvals(self, event_ids: Iterable[int] = (), guest_ids: Iterable[int] = ()) -> None:
+        event_ids, guest_ids = set(event_ids), set(guest_ids)
+        for approved in self.store.event_approvals.values():
+            approved -= event_ids
+        for approved in self.store.guest_approvals.values():
+            approved -= guest_ids
+
+    @with_lock
+    def delete(self, name: str) -> None:
+        token = self.get(name)
+
+        del self.store.tokens[token.id]
+        del self.store.token_ids[name]
+        self.store.event_approvals.pop(token.id, None)
+        self.store.guest_approvals.pop(token.id, None)
+
+
+@dataclasses.dataclass
+class Archive:
+    store: Store
+
+    @with_lock
+    def get(self, name: str) -> model.ArchivedEvent:
+        try:
+            return self.store.archive[name]
+        except KeyError:
+            raise LookupError(f"no event with name {name}")
+
+    @with_lock
+    def get_inactive(self, before: datetime.datetime) -> List[str]:
+        before = before.strftime("%Y-%m-%d %H:%M:%S")
+        return [event.name for event in self.store.events.values() if event.updated < before]
+
+    @with_lock
+    def archive(self, name: str) -> None:
+        event = Events(self.store).get_live(name)
+        guests = Guests(self.store).get_all(event.id)
+
+        Events(self.store).delete(name)
+        self.store.archive[name] = model.ArchivedEvent(**dataclasses.asdict(event), guests=guests)
+        Events(self.store).index_style(event)
+
+    @with_lock
+    def restore(self, name: str) -> None:
+        archived = self.get(name)
+
+        fields = {field.name: getattr(archived, field.name) for field in dataclasses.fields(model.Event)}
+        self.store.events[archived.id] = model.Event(**fields)
+        self.store.event_ids[name] = archived.id
+        Events(self.store).index_style(self.store.events[archived.id])
+        for guest in archived.guests:
+            self.store.guests[guest.id] = guest
+            self.store.guest_ids.setdefault(archived.id, {})[guest.name] = guest.id
+        del self.store.archive[name]
+        coherence.watcher.notify("event", archived.id)
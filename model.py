@@ -1,20 +1,17 @@
-from typing import List
+from typing import Iterable, List, Optional, Set
 import dataclasses
 import datetime
 import functools
 import hashlib
+import json
 import secrets
 import sqlite3
+import zlib
 
-
-SALT = b"mmmmsalty"
-TOKEN_LIFETIME_DAYS = 1
-
-try:
-    with open("admin.passhash") as f:
-        ADMIN_PASSHASH = f.read().strip()
-except FileNotFoundError:
-    ADMIN_PASSHASH = ""
+import cache
+import coherence
+import config
+import pubsub
 
 
 @dataclasses.dataclass
@@ -26,6 +23,7 @@ class Event:
     desc: str  # markdown, used as page body
     salt: bytes
     passhash: str
+    updated: str  # utc, "YYYY-MM-DD HH:MM:SS"; last write to the event or its guests
 
 
 @dataclasses.dataclass
@@ -40,6 +38,12 @@ class Guest:
     passhash: str
 
 
+@dataclasses.dataclass
+class ArchivedEvent(Event):
+    # read-only; the guests are stored with the event instead of in guest
+    guests: List[Guest] = dataclasses.field(default_factory=list)
+
+
 @dataclasses.dataclass
 class Token:
     id: int
@@ -48,11 +52,90 @@ class Token:
     expires: str
 
 
+@dataclasses.dataclass
+class Grants:
+    token: Token
+    events: Set[int]  # ids of events the token is approved for
+    guests: Set[int]  # ids of guests the token is approved for
+
+
+# token name -> Grants, shared by every request in this process
+auth_cache = cache.TTLCache(maxsize=4096, ttl=60)
+
+
+def forget_grants(event_ids: Iterable[int] = (), guest_ids: Iterable[int] = ()) -> None:
+    event_ids, guest_ids = set(event_ids), set(guest_ids)
+    for grants in auth_cache.values():
+        grants.events -= event_ids
+        grants.guests -= guest_ids
+
+
+def forget_token(token_id: int) -> None:
+    auth_cache.pop_where(lambda grants: grants.token.id == token_id)
+
+
+coherence.watcher.listen("token", forget_token)
+coherence.watcher.listen("pruned", lambda _: auth_cache.clear())
+
+
+@dataclasses.dataclass
+class EventMatch:
+    event: Event
+    snippet: str  # matched terms are wrapped in MATCH_START and MATCH_END
+    rank: float  # bm25, lower is better
+
+
+@dataclasses.dataclass
+class GuestMatch:
+    guest: Guest
+    snippet: str  # matched terms are wrapped in MATCH_START and MATCH_END
+
+
+MATCH_START = "\x02"
+MATCH_END = "\x03"
+
+
+def search_query(text: str) -> str:
+    # quote every term so user input can't use (or break) fts5 query syntax,
+    # and prefix-match so results show up while a word is half typed; fts5
+    # reads a NUL as the end of the query, so control characters go too
+    text = "".join(c if c.isprintable() else " " for c in text)
+    return " ".join('"' + term.replace('"', '""') + '"*' for term in text.split())
+
+
+def guest_topic(event_id: int) -> str:
+    return f"event:{event_id}"
+
+
+def guest_change(op: str, guest: Guest) -> dict:
+    # only what the guest list shows; never the salt or passhash
+    return {
+        "op": op,
+        "guest": {
+            "name": guest.name,
+            "title": guest.title,
+            "going": bool(guest.going),
+            "comment": guest.comment,
+        },
+    }
+
+
+def style_digest(style: str) -> str:
+    return hashlib.sha256(style.encode("utf-8")).hexdigest()[:16]
+
+
+def check_event_size(style: str, desc: str) -> None:
+    if len(style) > config.get().max_style_length:
+        raise ValueError(f"style must be at most {config.get().max_style_length} characters")
+    if len(desc) > config.get().max_desc_length:
+        raise ValueError(f"description must be at most {config.get().max_desc_length} characters")
+
+
 def hash_password(salt: bytes, password: str):
     hash_ = hashlib.sha256()
     hash_.update(password.encode("utf-8"))
     hash_.update(salt)
-    hash_.update(SALT)
+    hash_.update(config.get().salt)
     return hash_.hexdigest()
 
 
@@ -60,6 +143,10 @@ class AlreadyExistsError(Exception):
     pass
 
 
+class ArchivedError(LookupError):
+    pass
+
+
 def with_db(method):
     @functools.wraps(method)
     def wrapper(self, *args, **kwargs):
@@ -72,6 +159,11 @@ def with_db(method):
 @dataclasses.dataclass
 class Guests:
     db: sqlite3.Connection
+    # where tokens and approvals live if not in db (see sharding.py)
+    directory: Optional[sqlite3.Connection] = None
+
+    def tokens(self) -> "Tokens":
+        return Tokens(self.db if self.directory is None else self.directory)
 
     @with_db
     def get(self, event_id: int, name: str) -> Guest:
@@ -110,22 +202,63 @@ class Guests:
         return guests
 
     @with_db
+    def search(
+        self, event_id: int, query: str, limit: int = 20, offset: int = 0,
+    ) -> List[GuestMatch]:
+        match = search_query(query)
+        if not match:
+            return []
+
+        cursor = self.db.execute(
+            "SELECT guest.*, snippet(guestsearch, -1, ?, ?, '...', 16) AS snippet"
+            " FROM guestsearch JOIN guest ON guest.guestid = guestsearch.rowid"
+            " WHERE guestsearch MATCH ? AND guest.guestevent = ?"
+            " ORDER BY bm25(guestsearch, 10.0, 1.0)"
+            " LIMIT ? OFFSET ?",
+            (MATCH_START, MATCH_END, match, event_id, limit, offset),
+        )
+        rows = cursor.fetchall()
+
+        matches = []
+
+        for row in rows:
+            dict_ = {
+                field.name: row["guest" + field.name]
+                for field in dataclasses.fields(Guest)
+            }
+            matches.append(GuestMatch(guest=Guest(**dict_), snippet=row["snippet"]))
+
+        return matches
+
     def create(
-        self, event_id: int, name: str, title: str, password: str, going: bool, comment: str,
+        self,
+        event_id: int,
+        name: str,
+        title: str,
+        password: str,
+        going: bool,
+        comment: str,
+        id: Optional[int] = None,  # None picks the next one
     ) -> None:
-        try:
-            guest = self.get(event_id, name)
-        except LookupError:
-            salt = secrets.token_bytes(4)
-            passhash = hash_password(salt, password)
-            self.db.execute(
-                "INSERT INTO guest"
-                " (guestname, guesttitle, guestevent, guestgoing, guestcomment, guestsalt, guestpasshash)"
-                " VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (name, title, event_id, going, comment, salt, passhash),
-            )
-        else:
-            raise AlreadyExistsError(f"guest {name} of event {event_id} already exists")
+        # changes are published once committed, so that pages never show a
+        # write that didn't happen
+        with self.db:
+            try:
+                guest = self.get(event_id, name)
+            except LookupError:
+                salt = secrets.token_bytes(4)
+                passhash = hash_password(salt, password)
+                self.db.execute(
+                    "INSERT INTO guest"
+                    " (guestid, guestname, guesttitle, guestevent, guestgoing, guestcomment, guestsalt, guestpasshash)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (id, name, title, event_id, going, comment, salt, passhash),
+                )
+                guest = self.get(event_id, name)
+            else:
+                raise AlreadyExistsError(f"guest {name} of event {event_id} already exists")
+
+        pubsub.broker.publish(guest_topic(event_id), guest_change("create", guest))
 
     @with_db
     def approve_token(self, event_id: int, name: str, token: Token, password: str) -> None:
@@ -133,12 +266,7 @@ class Guests:
 
         passhash = hash_password(guest.salt, password)
         if passhash == guest.passhash:
-            self.db.execute(
-                "INSERT INTO guesttoken"
-                " (guesttokentoken, guesttokenguest)"
-                " VALUES (?, ?)",
-                (token.id, guest.id),
-            )
+            self.tokens().approve(token, guest_ids=[guest.id])
         else:
             raise PermissionError(f"bad password for guest {guest!r}")
     
@@ -146,43 +274,54 @@ class Guests:
     def check_token(self, event_id: int, name: str, token: Token) -> bool:
         guest = self.get(event_id, name)
 
-        cursor = self.db.execute(
-            "SELECT * FROM guesttoken"
-            " WHERE guesttokenguest = ? AND guesttokentoken = ?",
-            (guest.id, token.id),
-        )
-        row = cursor.fetchone()
-        return row is not None or token.admin
+        try:
+            approved = guest.id in self.tokens().grants(token.name).guests
+        except LookupError:
+            approved = False
+        return approved or token.admin
 
-    @with_db
     def update(
         self, event_id: int, name: str, going: bool, comment: str,
     ) -> None:
-        # raise LookupError if no such guest
-        self.get(event_id, name)
+        with self.db:
+            # raise LookupError if no such guest
+            self.get(event_id, name)
 
-        self.db.execute(
-            "UPDATE guest"
-            " SET guestgoing = ?, guestcomment = ?"
-            " WHERE guestname = ? AND guestevent = ?",
-            (going, comment, name, event_id),
-        )
+            self.db.execute(
+                "UPDATE guest"
+                " SET guestgoing = ?, guestcomment = ?"
+                " WHERE guestname = ? AND guestevent = ?",
+                (going, comment, name, event_id),
+            )
+            guest = self.get(event_id, name)
+
+        pubsub.broker.publish(guest_topic(event_id), guest_change("update", guest))
 
-    @with_db
     def delete(self, event_id: int, name: str) -> None:
-        # raise LookupError if no such guest
-        self.get(event_id, name)
+        with self.db:
+            # raise LookupError if no such guest
+            guest = self.get(event_id, name)
 
-        self.db.execute(
-            "DELETE FROM guest"
-            " WHERE guestname = ? AND guestevent = ?",
-            (name, event_id),
-        )
+            self.db.execute(
+                "DELETE FROM guest"
+                " WHERE guestname = ? AND guestevent = ?",
+                (name, event_id),
+            )
+            if self.directory is not None:
+                self.tokens().drop_approvals(guest_ids=[guest.id])
+            forget_grants(guest_ids=[guest.id])
+
+        pubsub.broker.publish(guest_topic(event_id), guest_change("delete", guest))
 
 
 @dataclasses.dataclass
 class Events:
     db: sqlite3.Connection
+    # where tokens and approvals live if not in db (see sharding.py)
+    directory: Optional[sqlite3.Connection] = None
+
+    def tokens(self) -> "Tokens":
+        return Tokens(self.db if self.directory is None else self.directory)
 
     @with_db
     def get(self, name: str) -> Event:
@@ -190,7 +329,8 @@ class Events:
         row = cursor.fetchone()
 
         if row is None:
-            raise LookupError(f"no event with name {name}")
+            # raises LookupError if it isn't archived either
+            return Archive(self.db, self.directory).get(name)
 
         else:
             dict_ = {
@@ -198,10 +338,16 @@ class Events:
                 for field in dataclasses.fields(Event)
             }
             return Event(**dict_)
+
+    def get_live(self, name: str) -> Event:
+        event = self.get(name)
+        if isinstance(event, ArchivedEvent):
+            raise ArchivedError(f"event {name} is archived")
+        return event
     
     @with_db
     def get_all(self) -> List[Event]:
-        cursor = self.db.execute("SELECT * FROM event")
+        cursor = self.db.execute("SELECT * FROM event ORDER BY eventid")
         rows = cursor.fetchall()
 
         events = []
@@ -214,6 +360,46 @@ class Events:
             events.append(Event(**dict_))
         
         return events
+
+    @with_db
+    def get_style(self, digest: str) -> str:
+        cursor = self.db.execute(
+            "SELECT eventstyle FROM event WHERE eventstylehash = ? LIMIT 1", (digest,),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            # raises LookupError if no archived event has it either
+            return Archive(self.db, self.directory).get_style(digest)
+        return row["eventstyle"]
+
+    @with_db
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[EventMatch]:
+        match = search_query(query)
+        if not match:
+            return []
+
+        cursor = self.db.execute(
+            "SELECT event.*, snippet(eventsearch, -1, ?, ?, '...', 16) AS snippet,"
+            " bm25(eventsearch, 10.0, 1.0) AS rank"
+            " FROM eventsearch JOIN event ON event.eventid = eventsearch.rowid"
+            " WHERE eventsearch MATCH ?"
+            " ORDER BY bm25(eventsearch, 10.0, 1.0)"
+            " LIMIT ? OFFSET ?",
+            (MATCH_START, MATCH_END, match, limit, offset),
+        )
+        rows = cursor.fetchall()
+
+        matches = []
+
+        for row in rows:
+            dict_ = {
+                field.name: row["event" + field.name]
+                for field in dataclasses.fields(Event)
+            }
+            matches.append(EventMatch(event=Event(**dict_), snippet=row["snippet"], rank=row["rank"]))
+
+        return matches
     
     @with_db
     def create(
@@ -223,7 +409,10 @@ class Events:
         style: str,
         title: str,
         desc: str,
+        id: Optional[int] = None,  # None picks the next one
     ) -> None:
+        check_event_size(style, desc)
+
         try:
             self.get(name)
         except LookupError:
@@ -231,25 +420,20 @@ class Events:
             passhash = hash_password(salt, password)
             self.db.execute(
                 "INSERT INTO event"
-                " (eventname, eventsalt, eventpasshash, eventstyle, eventtitle, eventdesc)"
-                " VALUES (?, ?, ?, ?, ?, ?)",
-                (name, salt, passhash, style, title, desc),
+                " (eventid, eventname, eventsalt, eventpasshash, eventstyle, eventstylehash, eventtitle, eventdesc)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (id, name, salt, passhash, style, style_digest(style), title, desc),
             )
         else:
             raise AlreadyExistsError
 
     @with_db
     def approve_token(self, name: str, token: Token, password: str) -> None:
-        event = self.get(name)
+        event = self.get_live(name)
 
         passhash = hash_password(event.salt, password)
         if passhash == event.passhash:
-            self.db.execute(
-                "INSERT INTO eventtoken"
-                " (eventtokentoken, eventtokenevent)"
-                " VALUES (?, ?)",
-                (token.id, event.id),
-            )
+            self.tokens().approve(token, event_ids=[event.id])
         else:
             raise PermissionError(f"bad password for event {event!r}")
     
@@ -257,13 +441,11 @@ class Events:
     def check_token(self, name: str, token: Token) -> bool:
         event = self.get(name)
 
-        cursor = self.db.execute(
-            "SELECT * FROM eventtoken"
-            " WHERE eventtokenevent = ? AND eventtokentoken = ?",
-            (event.id, token.id),
-        )
-        row = cursor.fetchone()
-        return row is not None or token.admin
+        try:
+            approved = event.id in self.tokens().grants(token.name).events
+        except LookupError:
+            approved = False
+        return approved or token.admin
 
     @with_db
     def update(
@@ -274,13 +456,14 @@ class Events:
         desc: str,
     ) -> None:
         # raise LookupError if no such event
-        event = self.get(name)
+        self.get_live(name)
+        check_event_size(style, desc)
 
         self.db.execute(
             "UPDATE event"
-            " SET eventtitle = ?, eventstyle = ?, eventdesc = ?"
+            " SET eventtitle = ?, eventstyle = ?, eventstylehash = ?, eventdesc = ?"
             " WHERE eventname = ?",
-            (title, style, desc, name),
+            (title, style, style_digest(style), desc, name),
         )
 
     @with_db
@@ -288,33 +471,61 @@ class Events:
         # raise LookupError if no such event
         event = self.get(name)
 
+        if isinstance(event, ArchivedEvent):
+            self.db.execute("DELETE FROM archive WHERE archiveid = ?", (event.id,))
+            return
+
+        cursor = self.db.execute("SELECT guestid FROM guest WHERE guestevent = ?", (event.id,))
+        guest_ids = [row["guestid"] for row in cursor.fetchall()]
+
+        # guests and approvals go with it (ON DELETE CASCADE)
         self.db.execute("DELETE FROM event WHERE eventname = ?", (name,))
-        self.db.execute("DELETE FROM guest WHERE guestevent = ?", (event.id,))
+        if self.directory is not None:
+            self.tokens().drop_approvals(event_ids=[event.id], guest_ids=guest_ids)
+        forget_grants(event_ids=[event.id], guest_ids=guest_ids)
 
 
 @dataclasses.dataclass
 class Tokens:
     db: sqlite3.Connection
 
-    @with_db
     def get(self, name: str) -> Token:
+        return self.grants(name).token
+
+    @with_db
+    def grants(self, name: str) -> Grants:
+        grants = auth_cache.get(name)
+        if grants is not None:
+            return grants
+
         cursor = self.db.execute("SELECT * FROM token WHERE tokenname = ?", (name,))
         row = cursor.fetchone()
 
         if row is None:
             raise LookupError(f"no token with name {name}")
 
-        else:
-            return Token(
-                id=row["tokenid"],
-                name=row["tokenname"],
-                admin=row["tokenadmin"],
-                expires=datetime.datetime.fromisoformat(row["tokenexpires"]),
-            )
+        token = Token(
+            id=row["tokenid"],
+            name=row["tokenname"],
+            admin=row["tokenadmin"],
+            expires=datetime.datetime.fromisoformat(row["tokenexpires"]),
+        )
+        cursor = self.db.execute(
+            "SELECT eventtokenevent FROM eventtoken WHERE eventtokentoken = ?", (token.id,),
+        )
+        events = {row["eventtokenevent"] for row in cursor.fetchall()}
+        cursor = self.db.execute(
+            "SELECT guesttokenguest FROM guesttoken WHERE guesttokentoken = ?", (token.id,),
+        )
+        guests = {row["guesttokenguest"] for row in cursor.fetchall()}
+
+        grants = Grants(token=token, events=events, guests=guests)
+        auth_cache.put(name, grants)
+        return grants
 
     @with_db
     def create(self, name: str) -> None:
-        expires = datetime.datetime.now() + datetime.timedelta(days=TOKEN_LIFETIME_DAYS)
+        expires = datetime.datetime.now() + datetime.timedelta(days=config.get().token_lifetime_days)
 
         try:
             self.get(name)
@@ -330,9 +541,9 @@ class Tokens:
     
     @with_db
     def refresh(self, name: str) -> None:
-        expires = datetime.datetime.now() + datetime.timedelta(days=TOKEN_LIFETIME_DAYS)
+        expires = datetime.datetime.now() + datetime.timedelta(days=config.get().token_lifetime_days)
 
-        self.get(name)
+        grants = self.grants(name)
 
         self.db.execute(
             "UPDATE token"
@@ -340,27 +551,152 @@ class Tokens:
             " WHERE tokenname = ?",
             (expires.isoformat(), name),
         )
+        grants.token = dataclasses.replace(grants.token, expires=expires)
 
     @with_db
     def set_admin(self, name: str, password: str) -> None:
         self.get(name)
 
-        passhash = hash_password(SALT, password)
-        if passhash == ADMIN_PASSHASH:
+        passhash = hash_password(config.get().salt, password)
+        if passhash == config.get().admin_passhash:
             self.db.execute(
                 "UPDATE token"
                 " SET tokenadmin = ?"
                 " WHERE tokenname = ?",
                 (True, name),
             )
+            auth_cache.pop(name)
         else:
             raise PermissionError(f"bad admin password")
 
+    @with_db
+    def approve(self, token: Token, event_ids: Iterable[int] = (), guest_ids: Iterable[int] = ()) -> None:
+        self.db.executemany(
+            "INSERT INTO eventtoken (eventtokentoken, eventtokenevent) VALUES (?, ?)",
+            [(token.id, event_id) for event_id in event_ids],
+        )
+        self.db.executemany(
+            "INSERT INTO guesttoken (guesttokentoken, guesttokenguest) VALUES (?, ?)",
+            [(token.id, guest_id) for guest_id in guest_ids],
+        )
+        auth_cache.pop(token.name)
+
+    @with_db
+    def drop_approvals(self, event_ids: Iterable[int] = (), guest_ids: Iterable[int] = ()) -> None:
+        # only needed when events live in another file than the tokens, out
+        # of reach of ON DELETE CASCADE
+        self.db.executemany(
+            "DELETE FROM eventtoken WHERE eventtokenevent = ?",
+            [(event_id,) for event_id in event_ids],
+        )
+        self.db.executemany(
+            "DELETE FROM guesttoken WHERE guesttokenguest = ?",
+            [(guest_id,) for guest_id in guest_ids],
+        )
+
     @with_db
     def delete(self, name: str) -> None:
         # raise LookupError if there is no token
         token = self.get(name)
 
         self.db.execute("DELETE FROM token WHERE tokenid = ?", (token.id,))
-        self.db.execute("DELETE FROM guesttoken WHERE guesttokentoken = ?", (token.id,))
-        self.db.execute("DELETE FROM eventtoken WHERE eventtokentoken = ?", (token.id,))
\ No newline at end of file
+        auth_cache.pop(name)
+
+
+@dataclasses.dataclass
+class Archive:
+    # events nobody has touched in a while, each stored as one compressed
+    # json blob with its guests so the hot tables and their indexes stay small
+    db: sqlite3.Connection
+    # where tokens and approvals live if not in db (see sharding.py)
+    directory: Optional[sqlite3.Connection] = None
+
+    @with_db
+    def get(self, name: str) -> ArchivedEvent:
+        cursor = self.db.execute("SELECT * FROM archive WHERE archivename = ?", (name,))
+        row = cursor.fetchone()
+
+        if row is None:
+            raise LookupError(f"no event with name {name}")
+
+        data = json.loads(zlib.decompress(row["archivedata"]))
+        event = data["event"]
+        event["salt"] = bytes.fromhex(event["salt"])
+        guests = []
+        for guest in data["guests"]:
+            guest["salt"] = bytes.fromhex(guest["salt"])
+            guests.append(Guest(**guest))
+
+        return ArchivedEvent(**event, guests=guests)
+
+    @with_db
+    def get_style(self, digest: str) -> str:
+        cursor = self.db.execute(
+            "SELECT archivename FROM archive WHERE archivestylehash = ? LIMIT 1", (digest,),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            raise LookupError(f"no style with hash {digest}")
+        return self.get(row["archivename"]).style
+
+    @with_db
+    def get_inactive(self, before: datetime.datetime) -> List[str]:
+        cursor = self.db.execute(
+            "SELECT eventname FROM event WHERE eventupdated < ?",
+            (before.strftime("%Y-%m-%d %H:%M:%S"),),
+        )
+        return [row["eventname"] for row in cursor.fetchall()]
+
+    @with_db
+    def archive(self, name: str) -> None:
+        event = Events(self.db, self.directory).get_live(name)
+        guests = Guests(self.db, self.directory).get_all(event.id)
+
+        data = {
+            "event": dataclasses.asdict(event),
+            "guests": [dataclasses.asdict(guest) for guest in guests],
+        }
+        data["event"]["salt"] = event.salt.hex()
+        for guest, dict_ in zip(guests, data["guests"]):
+            dict_["salt"] = guest.salt.hex()
+
+        self.db.execute(
+            "INSERT INTO archive"
+            " (archiveid, archivename, archiveupdated, archivedata, archivestylehash)"
+            " VALUES (?, ?, ?, ?, ?)",
+            (
+                event.id, name, event.updated,
+                zlib.compress(json.dumps(data).encode("utf-8"), 9), style_digest(event.style),
+            ),
+        )
+
+        # approvals are dropped: tokens expire long before events get archived
+        self.db.execute("DELETE FROM event WHERE eventid = ?", (event.id,))
+        if self.directory is not None:
+            Tokens(self.directory).drop_approvals(event_ids=[event.id], guest_ids=[guest.id for guest in guests])
+        forget_grants(event_ids=[event.id], guest_ids=[guest.id for guest in guests])
+
+    @with_db
+    def restore(self, name: str) -> None:
+        event = self.get(name)
+
+        # ids are kept so that links and caches keyed on them stay valid
+        self.db.execute(
+            "INSERT INTO event"
+            " (eventid, eventname, eventsalt, eventpasshash, eventstyle, eventstylehash, eventtitle, eventdesc)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                event.id, event.name, event.salt, event.passhash,
+                event.style, style_digest(event.style), event.title, event.desc,
+            ),
+        )
+        for guest in event.guests:
+            self.db.execute(
+                "INSERT INTO guest"
+                " (guestid, guestname, guesttitle, guestevent, guestgoing, guestcomment, guestsalt, guestpasshash)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (guest.id, guest.name, guest.title, event.id, guest.going, guest.comment, guest.salt, guest.passhash),
+            )
+
+        self.db.execute("DELETE FROM archive WHERE archiveid = ?", (event.id,))
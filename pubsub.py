@@ -0,0 +1,46 @@
+from typing import Any, Dict, Set
+import dataclasses
+import queue
+import threading
+
+
+@dataclasses.dataclass(eq=False)
+class Subscription:
+    topic: str
+    queue: queue.Queue
+    overflowed: bool = False  # set when the subscriber fell behind and missed messages
+
+
+@dataclasses.dataclass
+class Broker:
+    queue_size: int = 64
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    subscriptions: Dict[str, Set[Subscription]] = dataclasses.field(default_factory=dict)
+
+    def subscribe(self, topic: str) -> Subscription:
+        subscription = Subscription(topic=topic, queue=queue.Queue(maxsize=self.queue_size))
+        with self.lock:
+            self.subscriptions.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self.lock:
+            subscriptions = self.subscriptions.get(subscription.topic, set())
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                self.subscriptions.pop(subscription.topic, None)
+
+    def publish(self, topic: str, message: Any) -> None:
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(topic, ()))
+
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # never block a writer on a slow reader; it has to start over
+                subscription.overflowed = True
+                self.unsubscribe(subscription)
+
+
+broker = Broker()
@@ -0,0 +1,84 @@
+from typing import Hashable, Optional
+import collections
+import dataclasses
+import threading
+import time
+
+
+@dataclasses.dataclass
+class Bucket:
+    tokens: float
+    updated: float
+
+
+@dataclasses.dataclass
+class RateLimiter:
+    rate: float  # tokens added per second
+    burst: float  # most tokens a bucket holds
+    maxsize: int = 65536  # least recently used buckets are forgotten past this
+    buckets: collections.OrderedDict = dataclasses.field(default_factory=collections.OrderedDict)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+    def allow(self, key: Hashable) -> bool:
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.pop(key, None)
+            if bucket is None:
+                tokens = self.burst
+            else:
+                tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+
+            self.buckets[key] = Bucket(tokens=tokens, updated=now)
+            while len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+
+            return allowed
+
+    def retry_after(self) -> int:
+        # seconds until an empty bucket has a token again
+        return max(1, round(1 / self.rate))
+
+
+@dataclasses.dataclass
+class LoadShedder:
+    max_in_flight: Optional[int]
+    max_latency: Optional[float]  # seconds
+    half_life: float = 1  # seconds for the latency average to halve when idle
+    in_flight: int = 0
+    latency: float = 0  # exponentially weighted average of recent requests
+    updated: float = dataclasses.field(default_factory=time.monotonic)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+
+    def _decay(self, now: float) -> None:
+        # decay with time too, otherwise once we shed everything no request
+        # would ever finish to bring the average back down
+        self.latency *= 0.5 ** ((now - self.updated) / self.half_life)
+        self.updated = now
+
+    def enter(self) -> bool:
+        with self.lock:
+            self._decay(time.monotonic())
+            if self.max_in_flight is not None and self.in_flight >= self.max_in_flight:
+                return False
+            if self.max_latency is not None and self.latency > self.max_latency:
+                return False
+            self.in_flight += 1
+            return True
+
+    def busy(self) -> bool:
+        # past half of either limit; background work backs off
+        with self.lock:
+            self._decay(time.monotonic())
+            if self.max_in_flight is not None and self.in_flight * 2 >= self.max_in_flight:
+                return True
+            return self.max_latency is not None and self.latency * 2 > self.max_latency
+
+    def leave(self, elapsed: float) -> None:
+        with self.lock:
+            self._decay(time.monotonic())
+            self.in_flight -= 1
+            self.latency = 0.9 * self.latency + 0.1 * elapsed
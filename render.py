@@ -0,0 +1,92 @@
+from typing import Optional
+import atexit
+import hashlib
+import multiprocessing
+import multiprocessing.pool
+import threading
+
+import markupsafe
+
+import cache
+import config
+
+
+# sha256 of the markdown -> html; rendering is deterministic so never stale
+results = cache.TTLCache(maxsize=1024, ttl=None)
+
+# renders that timed out, shown as plain text; retried now and then
+failures = cache.TTLCache(maxsize=1024, ttl=300)
+
+_pool: Optional[multiprocessing.pool.Pool] = None
+_pool_lock = threading.Lock()
+
+
+def _render(text: str) -> str:
+    import markdown
+    return markdown.markdown(text)
+
+
+def get_pool() -> multiprocessing.pool.Pool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn rather than fork: forking a threaded server is asking for trouble
+            context = multiprocessing.get_context("spawn")
+            _pool = context.Pool(config.get().render_processes)
+        return _pool
+
+
+def kill_pool(pool: multiprocessing.pool.Pool) -> bool:
+    # the only way to stop a runaway render; the next render starts a new
+    # pool. Returns False if another thread already killed it
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return False
+        _pool = None
+    pool.terminate()
+    return True
+
+
+@atexit.register
+def close_pool() -> None:
+    # a pool left to the garbage collector at exit complains about its
+    # half-torn-down queues
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        kill_pool(pool)
+
+
+def plain_text(text: str) -> str:
+    return str(markupsafe.Markup("<pre>{}</pre>").format(text))
+
+
+def render_markdown(text: str) -> str:
+    key = hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    html = results.get(key)
+    if html is None:
+        html = failures.get(key)
+    if html is not None:
+        return html
+
+    # a render killed along with someone else's runaway one gets one more go
+    for _ in range(2):
+        pool = get_pool()
+        try:
+            html = pool.apply_async(_render, (text,)).get(timeout=config.get().render_timeout)
+        except multiprocessing.TimeoutError:
+            if kill_pool(pool):
+                # ours is the one that ran over
+                html = plain_text(text)
+                failures.put(key, html)
+                return html
+        except ValueError:
+            # another thread killed the pool under us
+            pass
+        else:
+            results.put(key, html)
+            return html
+
+    return plain_text(text)
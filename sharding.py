@@ -0,0 +1,430 @@
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+import argparse
+import concurrent.futures
+import dataclasses
+import datetime
+import glob
+import heapq
+import json
+import os
+import re
+import secrets
+import sqlite3
+import threading
+import zlib
+
+import config
+import initdb
+import model
+
+
+T = TypeVar("T")
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def shard_of(name: str, shards: int) -> int:
+    # crc32 rather than hash(), which differs between processes
+    return zlib.crc32(name.encode("utf-8")) % shards
+
+
+def get_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                config.get().shards, thread_name_prefix="shard",
+            )
+        return _executor
+
+
+def connect_file(path: str) -> sqlite3.Connection:
+    db = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=False,
+    )
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    return db
+
+
+@dataclasses.dataclass
+class Shards:
+    # tokens, approvals and the event index live in the directory; each event
+    # and its guests live in one shard, so writes to events in different
+    # shards don't wait on each other's locks
+    directory: sqlite3.Connection
+    shards: List[sqlite3.Connection]
+
+    def all(self) -> List[sqlite3.Connection]:
+        return [self.directory] + self.shards
+
+    def rollback(self) -> None:
+        for db in self.all():
+            db.rollback()
+
+    def close(self) -> None:
+        for db in self.all():
+            db.close()
+
+    def locate(self, name: str) -> int:
+        cursor = self.directory.execute(
+            "SELECT eventindexshard FROM eventindex WHERE eventindexname = ?", (name,),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            raise LookupError(f"no event with name {name}")
+        return row["eventindexshard"]
+
+    def locate_id(self, event_id: int) -> int:
+        cursor = self.directory.execute(
+            "SELECT eventindexshard FROM eventindex WHERE eventindexid = ?", (event_id,),
+        )
+        row = cursor.fetchone()
+
+        if row is None:
+            raise LookupError(f"no event with id {event_id}")
+        return row["eventindexshard"]
+
+    def map(self, func: Callable[[sqlite3.Connection], T]) -> List[T]:
+        # each connection is only ever used by one thread at a time
+        return list(get_executor().map(func, self.shards))
+
+
+def connect() -> Shards:
+    return Shards(
+        directory=connect_file(config.get().directory_path()),
+        shards=[connect_file(path) for path in config.get().shard_paths()],
+    )
+
+
+@dataclasses.dataclass
+class Guests:
+    shards: Shards
+
+    def shard(self, event_id: int) -> model.Guests:
+        db = self.shards.shards[self.shards.locate_id(event_id)]
+        return model.Guests(db, self.shards.directory)
+
+    def get(self, event_id: int, name: str) -> model.Guest:
+        return self.shard(event_id).get(event_id, name)
+
+    def get_all(self, event_id: int) -> List[model.Guest]:
+        return self.shard(event_id).get_all(event_id)
+
+    def search(
+        self, event_id: int, query: str, limit: int = 20, offset: int = 0,
+    ) -> List[model.GuestMatch]:
+        return self.shard(event_id).search(event_id, query, limit, offset)
+
+    def create(
+        self, event_id: int, name: str, title: str, password: str, going: bool, comment: str,
+    ) -> None:
+        # random rather than counted per shard, so that ids stay unique when
+        # rebalancing moves guests to another shard
+        id_ = secrets.randbelow(2 ** 62)
+        self.shard(event_id).create(event_id, name, title, password, going, comment, id=id_)
+
+    def approve_token(self, event_id: int, name: str, token: model.Token, password: str) -> None:
+        self.shard(event_id).approve_token(event_id, name, token, password)
+
+    def check_token(self, event_id: int, name: str, token: model.Token) -> bool:
+        return self.shard(event_id).check_token(event_id, name, token)
+
+    def update(self, event_id: int, name: str, going: bool, comment: str) -> None:
+        self.shard(event_id).update(event_id, name, going, comment)
+
+    def delete(self, event_id: int, name: str) -> None:
+        self.shard(event_id).delete(event_id, name)
+
+
+@dataclasses.dataclass
+class Events:
+    shards: Shards
+
+    def shard(self, name: str) -> model.Events:
+        db = self.shards.shards[self.shards.locate(name)]
+        return model.Events(db, self.shards.directory)
+
+    def get(self, name: str) -> model.Event:
+        return self.shard(name).get(name)
+
+    def get_live(self, name: str) -> model.Event:
+        return self.shard(name).get_live(name)
+
+    def get_all(self) -> List[model.Event]:
+        # every shard lists its events in id order, so merging keeps it
+        events = self.shards.map(lambda db: model.Events(db).get_all())
+        return list(heapq.merge(*events, key=lambda event: event.id))
+
+    def get_style(self, digest: str) -> str:
+        def get_style(db: sqlite3.Connection) -> Optional[str]:
+            try:
+                return model.Events(db).get_style(digest)
+            except LookupError:
+                return None
+
+        for style in self.shards.map(get_style):
+            if style is not None:
+                return style
+        raise LookupError(f"no style with hash {digest}")
+
+    def search(self, query: str, limit: int = 20, offset: int = 0) -> List[model.EventMatch]:
+        matches = self.shards.map(lambda db: model.Events(db).search(query, limit + offset))
+        return list(heapq.merge(*matches, key=lambda match: match.rank))[offset:offset + limit]
+
+    def create(self, name: str, password: str, style: str, title: str, desc: str) -> None:
+        model.check_event_size(style, desc)
+
+        shard = shard_of(name, len(self.shards.shards))
+        try:
+            with self.shards.directory:
+                cursor = self.shards.directory.execute(
+                    "INSERT INTO eventindex (eventindexname, eventindexshard) VALUES (?, ?)",
+                    (name, shard),
+                )
+        except sqlite3.IntegrityError:
+            raise model.AlreadyExistsError
+
+        try:
+            model.Events(self.shards.shards[shard], self.shards.directory).create(
+                name, password, style, title, desc, id=cursor.lastrowid,
+            )
+        except Exception:
+            with self.shards.directory:
+                self.shards.directory.execute(
+                    "DELETE FROM eventindex WHERE eventindexid = ?", (cursor.lastrowid,),
+                )
+            raise
+
+    def approve_token(self, name: str, token: model.Token, password: str) -> None:
+        self.shard(name).approve_token(name, token, password)
+
+    def check_token(self, name: str, token: model.Token) -> bool:
+        return self.shard(name).check_token(name, token)
+
+    def update(self, name: str, style: str, title: str, desc: str) -> None:
+        self.shard(name).update(name, style, title, desc)
+
+    def delete(self, name: str) -> None:
+        self.shard(name).delete(name)
+
+        with self.shards.directory:
+            self.shards.directory.execute("DELETE FROM eventindex WHERE eventindexname = ?", (name,))
+
+
+@dataclasses.dataclass
+class Archive:
+    shards: Shards
+
+    def shard(self, name: str) -> model.Archive:
+        db = self.shards.shards[self.shards.locate(name)]
+        return model.Archive(db, self.shards.directory)
+
+    def get(self, name: str) -> model.ArchivedEvent:
+        return self.shard(name).get(name)
+
+    def get_inactive(self, before: datetime.datetime) -> List[str]:
+        names = self.shards.map(lambda db: model.Archive(db).get_inactive(before))
+        return [name for shard_names in names for name in shard_names]
+
+    def archive(self, name: str) -> None:
+        self.shard(name).archive(name)
+
+    def restore(self, name: str) -> None:
+        self.shard(name).restore(name)
+
+
+def copy_rows(
+    source: sqlite3.Connection,
+    target: sqlite3.Connection,
+    table: str,
+    column: str,
+    value,
+    overrides: Optional[Dict[str, Any]] = None,  # column -> value to write instead
+) -> None:
+    rows = source.execute(f"SELECT * FROM {table} WHERE {column} = ?", (value,)).fetchall()
+    for row in rows:
+        values = {**dict(row), **(overrides or {})}
+        columns = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        target.execute(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", tuple(values.values()))
+
+
+def fingerprint(db: sqlite3.Connection, event_id: int) -> Optional[Tuple[str, bytes]]:
+    # name and salt, which tell an event from another one that was given the
+    # same name or id in another file
+    row = db.execute("SELECT eventname, eventsalt FROM event WHERE eventid = ?", (event_id,)).fetchone()
+    if row is not None:
+        return row["eventname"], row["eventsalt"]
+
+    row = db.execute("SELECT archivename, archivedata FROM archive WHERE archiveid = ?", (event_id,)).fetchone()
+    if row is not None:
+        data = json.loads(zlib.decompress(row["archivedata"]))
+        return row["archivename"], bytes.fromhex(data["event"]["salt"])
+
+    return None
+
+
+def renumber_archive(data: bytes, event_id: int) -> bytes:
+    data = json.loads(zlib.decompress(data))
+    data["event"]["id"] = event_id
+    for guest in data["guests"]:
+        guest["event"] = event_id
+    return zlib.compress(json.dumps(data).encode("utf-8"), 9)
+
+
+def reserve(directory: sqlite3.Connection, shard: int, event_id: int, name: str) -> int:
+    # the event keeps its id unless another event has it, e.g. one created
+    # after sharding was turned on while this one sat in the unsharded file
+    for id_ in (event_id, None):
+        try:
+            with directory:
+                cursor = directory.execute(
+                    "INSERT INTO eventindex (eventindexid, eventindexname, eventindexshard) VALUES (?, ?, ?)",
+                    (id_, name, shard),
+                )
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            if directory.execute(
+                "SELECT * FROM eventindex WHERE eventindexname = ?", (name,),
+            ).fetchone() is not None:
+                raise model.AlreadyExistsError(f"another event is called {name}")
+    raise AssertionError("unreachable")
+
+
+def move(
+    directory: sqlite3.Connection,
+    source: sqlite3.Connection,
+    source_shard: Optional[int],  # None for the unsharded file
+    target: sqlite3.Connection,
+    shard: int,
+    event_id: int,
+    name: str,
+) -> None:
+    # writes to the event wait until it's moved. A move cut short leaves the
+    # event indexed in the target, maybe with a copy there, which the next
+    # run replaces. Raises AlreadyExistsError, and moves nothing, if another
+    # event has the name
+    source.execute("BEGIN IMMEDIATE")
+    try:
+        ours = fingerprint(source, event_id)
+
+        row = directory.execute(
+            "SELECT eventindexid, eventindexshard FROM eventindex WHERE eventindexname = ?", (name,),
+        ).fetchone()
+        if row is None:
+            new_id = reserve(directory, shard, event_id, name)
+        else:
+            # ours if it's where we moved (or are moving) it from or to
+            new_id = row["eventindexid"]
+            holder = {source_shard: source, shard: target}.get(row["eventindexshard"])
+            found = None if holder is None else fingerprint(holder, new_id)
+            if found != ours and not (found is None and row["eventindexshard"] == shard):
+                raise model.AlreadyExistsError(f"another event is called {name}")
+
+        cursor = source.execute("SELECT eventupdated FROM event WHERE eventid = ?", (event_id,))
+        updated = cursor.fetchone()
+        cursor = source.execute("SELECT archivedata FROM archive WHERE archiveid = ?", (event_id,))
+        archived = cursor.fetchone()
+
+        with target:
+            # new_id is indexed under this name, so only a copy of ours can be there
+            target.execute("DELETE FROM event WHERE eventid = ?", (new_id,))
+            target.execute("DELETE FROM archive WHERE archiveid = ?", (new_id,))
+            copy_rows(source, target, "event", "eventid", event_id, {"eventid": new_id})
+            copy_rows(source, target, "guest", "guestevent", event_id, {"guestevent": new_id})
+            if archived is not None:
+                copy_rows(source, target, "archive", "archiveid", event_id, {
+                    "archiveid": new_id,
+                    "archivedata": renumber_archive(archived["archivedata"], new_id),
+                })
+            if updated is not None:
+                # the insert triggers count the copy as activity; it isn't
+                target.execute(
+                    "UPDATE event SET eventupdated = ? WHERE eventid = ?",
+                    (updated["eventupdated"], new_id),
+                )
+            initdb.fill_style_hashes(target)
+
+        with directory:
+            directory.execute(
+                "UPDATE eventindex SET eventindexshard = ? WHERE eventindexid = ?", (shard, new_id),
+            )
+
+        source.execute("DELETE FROM event WHERE eventid = ?", (event_id,))
+        source.execute("DELETE FROM archive WHERE archiveid = ?", (event_id,))
+        source.commit()
+    except BaseException:
+        source.rollback()
+        raise
+
+
+def rebalance(
+    directory: sqlite3.Connection,
+    sources: List[Tuple[str, Optional[int]]],  # path and shard number, None if unsharded
+    targets: List[sqlite3.Connection],
+) -> None:
+    for path, source_shard in sources:
+        source = connect_file(path)
+        try:
+            cursor = source.execute("SELECT * FROM sqlite_master WHERE type = 'table' AND name = 'event'")
+            if cursor.fetchone() is None:
+                continue
+            # bring files from older versions (an unsharded events.db, or a
+            # shard beyond the current count) up to the schema move expects
+            initdb.init_db(source)
+
+            rows = source.execute(
+                "SELECT eventid AS id, eventname AS name FROM event"
+                " UNION ALL SELECT archiveid, archivename FROM archive",
+            ).fetchall()
+
+            for row in rows:
+                shard = shard_of(row["name"], len(targets))
+                if shard == source_shard:
+                    continue
+                try:
+                    move(directory, source, source_shard, targets[shard], shard, row["id"], row["name"])
+                except model.AlreadyExistsError as e:
+                    print(f"left {row['name']} in {path}: {e}")
+                else:
+                    print(f"moved {row['name']} from {path} to shard {shard}")
+        finally:
+            source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="move events to the shard their name hashes to, e.g. after changing EVENT_SHARDS",
+    )
+    parser.parse_args()
+
+    settings = config.get()
+    if settings.shards < 2:
+        parser.error("set EVENT_SHARDS to 2 or more")
+
+    root, ext = os.path.splitext(settings.db_path)
+    # the unsharded database, and every shard file, including any beyond the
+    # current count
+    sources = []
+    if os.path.exists(settings.db_path):
+        sources.append((settings.db_path, None))
+    for path in glob.glob(f"{root}.[0-9]*{ext}"):
+        match = re.fullmatch(re.escape(root) + r"\.(\d+)" + re.escape(ext), path)
+        if match is not None:
+            sources.append((path, int(match.group(1))))
+    sources.sort(key=lambda source: -1 if source[1] is None else source[1])
+
+    shards = connect()
+    try:
+        rebalance(shards.directory, sources, shards.shards)
+    finally:
+        shards.close()
+
+
+if __name__ == "__main__":
+    main()
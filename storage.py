@@ -0,0 +1,138 @@
+import abc
+import dataclasses
+import sqlite3
+
+import coherence
+import config
+import memory
+import model
+import sharding
+
+
+class Engine(abc.ABC):
+    # what the website needs from storage. Each request takes one from a
+    # pool and rolls it back when done. The repositories an engine hands out
+    # have the same methods as model.Events, model.Guests, model.Tokens and
+    # model.Archive; see memory.py for one that isn't sqlite
+
+    @abc.abstractmethod
+    def events(self):
+        ...
+
+    @abc.abstractmethod
+    def guests(self):
+        ...
+
+    @abc.abstractmethod
+    def tokens(self):
+        ...
+
+    @abc.abstractmethod
+    def archive(self):
+        ...
+
+    def check_coherence(self) -> None:
+        # called before each request to drop whatever other workers have
+        # changed under this one's caches
+        pass
+
+    def warm_up(self) -> None:
+        pass
+
+    def rollback(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+@dataclasses.dataclass
+class SQLite(Engine):
+    db: sqlite3.Connection
+
+    def events(self) -> model.Events:
+        return model.Events(self.db)
+
+    def guests(self) -> model.Guests:
+        return model.Guests(self.db)
+
+    def tokens(self) -> model.Tokens:
+        return model.Tokens(self.db)
+
+    def archive(self) -> model.Archive:
+        return model.Archive(self.db)
+
+    def check_coherence(self) -> None:
+        coherence.watcher.check()
+
+    def warm_up(self) -> None:
+        self.db.execute("SELECT * FROM sqlite_master").fetchall()
+
+    def rollback(self) -> None:
+        self.db.rollback()
+
+    def close(self) -> None:
+        self.db.close()
+
+
+@dataclasses.dataclass
+class Sharded(Engine):
+    shards: sharding.Shards
+
+    def events(self) -> sharding.Events:
+        return sharding.Events(self.shards)
+
+    def guests(self) -> sharding.Guests:
+        return sharding.Guests(self.shards)
+
+    def tokens(self) -> model.Tokens:
+        return model.Tokens(self.shards.directory)
+
+    def archive(self) -> sharding.Archive:
+        return sharding.Archive(self.shards)
+
+    def check_coherence(self) -> None:
+        coherence.watcher.check()
+
+    def warm_up(self) -> None:
+        for db in self.shards.all():
+            db.execute("SELECT * FROM sqlite_master").fetchall()
+
+    def rollback(self) -> None:
+        self.shards.rollback()
+
+    def close(self) -> None:
+        self.shards.close()
+
+
+@dataclasses.dataclass
+class Memory(Engine):
+    # no check_coherence: there are no other workers, and the store notifies
+    # the watcher itself
+    store: memory.Store
+
+    def events(self) -> memory.Events:
+        return memory.Events(self.store)
+
+    def guests(self) -> memory.Guests:
+        return memory.Guests(self.store)
+
+    def tokens(self) -> memory.Tokens:
+        return memory.Tokens(self.store)
+
+    def archive(self) -> memory.Archive:
+        return memory.Archive(self.store)
+
+
+def connect() -> Engine:
+    settings = config.get()
+
+    if settings.storage == "memory":
+        return Memory(memory.store)
+
+    if settings.storage != "sqlite":
+        raise ValueError(f"unknown storage engine {settings.storage!r}")
+
+    if settings.shards > 1:
+        return Sharded(sharding.connect())
+    return SQLite(sharding.connect_file(settings.db_path))
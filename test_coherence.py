@@ -0,0 +1,133 @@
+from typing import Optional
+import multiprocessing
+import multiprocessing.connection
+import sqlite3
+
+import pytest
+
+import coherence
+import config
+import initdb
+import model
+import website
+
+
+# Two workers on one database, each with its own caches, the way gunicorn
+# runs the site. "a" runs in a separate process; "b" is this one.
+
+
+def serve(db_path: str, requests: multiprocessing.connection.Connection) -> None:
+    app = website.create_app(config.Config(db_path=db_path))
+    client = app.test_client(use_cookies=False)
+
+    for method, url, data, cookie in iter(requests.recv, None):
+        headers = {"Cookie": f"token={cookie}"} if cookie else {}
+        response = client.open(url, method=method, data=data, headers=headers)
+        requests.send((
+            response.status_code,
+            response.get_data(as_text=True),
+            response.headers.getlist("Set-Cookie"),
+        ))
+
+
+class Worker:
+    def __init__(self, db_path: str):
+        context = multiprocessing.get_context("spawn")
+        self.requests, child = context.Pipe()
+        self.process = context.Process(target=serve, args=(db_path, child))
+        self.process.start()
+
+    def request(self, method: str, url: str, data: Optional[dict] = None, cookie: str = ""):
+        self.requests.send((method, url, data, cookie))
+        return self.requests.recv()
+
+    def stop(self) -> None:
+        self.requests.send(None)
+        self.process.join(timeout=10)
+
+
+def token_of(set_cookies) -> str:
+    for header in set_cookies:
+        if header.startswith("token="):
+            return header.split(";")[0].split("=", 1)[1]
+    raise AssertionError(f"no token cookie in {set_cookies}")
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "events.db")
+    db = sqlite3.connect(path)
+    db.execute("PRAGMA foreign_keys = ON")
+    initdb.init_db(db)
+    db.close()
+    return path
+
+
+@pytest.fixture
+def a(db_path):
+    worker = Worker(db_path)
+    yield worker
+    worker.stop()
+
+
+@pytest.fixture
+def b(db_path):
+    coherence.watcher.close()
+    model.auth_cache.clear()
+    website.pages.clear()
+    app = website.create_app(config.Config(db_path=db_path))
+    yield app.test_client(use_cookies=False)
+    coherence.watcher.close()
+
+
+def test_revoked_token_is_dropped_by_other_worker(a, b):
+    status, _, cookies = a.request("GET", "/")
+    token = token_of(cookies)
+    a.request("POST", "/api/event", {"name": "party", "password": "pw"}, token)
+
+    status, body, _ = a.request("GET", "/party/edit", cookie=token)
+    assert status == 200 and "saved until" in body  # approved, and cached in a
+
+    response = b.get("/api/revoke", headers={"Cookie": f"token={token}"})
+    assert response.status_code == 302
+
+    # the very next request in a no longer sees the approval
+    status, body, cookies = a.request("GET", "/party/edit", cookie=token)
+    assert status == 200 and "saved until" not in body
+    assert token_of(cookies) != token
+
+
+def test_guest_change_shows_on_other_workers_cached_page(a, b):
+    _, _, cookies = a.request("GET", "/")
+    token = token_of(cookies)
+    a.request("POST", "/api/event", {"name": "party", "password": "pw"}, token)
+
+    status, body, _ = a.request("GET", "/party", cookie=token)
+    assert status == 200 and "zelda" not in body  # cached in a
+
+    response = b.post(
+        "/api/event/party/guest",
+        data={"name": "zelda", "going": "going", "comment": "", "password": "x"},
+    )
+    assert response.status_code == 302
+
+    status, body, _ = a.request("GET", "/party", cookie=token)
+    assert status == 200 and "zelda" in body
+
+
+def test_prune_makes_lagging_worker_drop_its_caches(a, b, db_path):
+    _, _, cookies = a.request("GET", "/")
+    token = token_of(cookies)
+    a.request("POST", "/api/event", {"name": "party", "password": "pw"}, token)
+    status, body, _ = a.request("GET", "/party/edit", cookie=token)
+    assert "saved until" in body
+
+    b.get("/api/revoke", headers={"Cookie": f"token={token}"})
+
+    db = sqlite3.connect(db_path, isolation_level=None)
+    assert coherence.prune(db, keep=0) > 0
+    db.close()
+
+    # the revocation's row is gone, but a still drops the approval
+    status, body, _ = a.request("GET", "/party/edit", cookie=token)
+    assert status == 200 and "saved until" not in body
@@ -0,0 +1,114 @@
+import sqlite3
+
+import pytest
+
+import initdb
+import model
+
+
+# the schema before any migrations, as the first deployments made it
+BASELINE = """
+CREATE TABLE event (
+  eventid INTEGER PRIMARY KEY AUTOINCREMENT,
+  eventname TEXT UNIQUE NOT NULL,
+  eventsalt TEXT NOT NULL,
+  eventpasshash TEXT NOT NULL,
+  eventtitle TEXT NOT NULL,
+  eventstyle TEXT NOT NULL,
+  eventdesc TEXT NOT NULL
+);
+
+CREATE TABLE guest  (
+  guestid INTEGER PRIMARY KEY AUTOINCREMENT,
+  guestevent INTEGER NOT NULL,
+  guestname TEXT NOT NULL,
+  guesttitle TEXT NOT NULL,
+  guestgoing BOOLEAN NOT NULL,
+  guestcomment TEXT NOT NULL,
+  guestsalt TEXT NOT NULL,
+  guestpasshash TEXT NOT NULL,
+  FOREIGN KEY (guestevent) REFERENCES event(eventid),
+  UNIQUE (guestevent, guestname)
+);
+
+CREATE TABLE token (
+  tokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  tokenname TEXT NOT NULL,
+  tokenadmin BOOLEAN NOT NULL,
+  tokenexpires TEXT NOT NULL,
+  UNIQUE (tokenname)
+);
+
+CREATE TABLE eventtoken (
+  eventtokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  eventtokenevent INTEGER NOT NULL,
+  eventtokentoken INTEGER NOT NULL,
+  FOREIGN KEY (eventtokenevent) REFERENCES event(eventid),
+  FOREIGN KEY (eventtokentoken) REFERENCES token(tokenid)
+);
+
+CREATE TABLE guesttoken (
+  guesttokenid INTEGER PRIMARY KEY AUTOINCREMENT,
+  guesttokenguest INTEGER NOT NULL,
+  guesttokentoken INTEGER NOT NULL,
+  FOREIGN KEY (guesttokenguest) REFERENCES guest(guestid),
+  FOREIGN KEY (guesttokentoken) REFERENCES token(tokenid)
+);
+
+INSERT INTO event VALUES (1, 'party', 'salt', 'hash', 'Party', 'p{color:red}', 'bring snacks');
+INSERT INTO guest VALUES (1, 1, 'zelda', 'Zelda', 1, 'hi', 'salt', 'hash');
+INSERT INTO token VALUES (1, 'tok', 0, '2030-01-01 00:00:00');
+INSERT INTO eventtoken VALUES (1, 1, 1);
+INSERT INTO guesttoken VALUES (1, 1, 1);
+"""
+
+
+def connect(path) -> sqlite3.Connection:
+    db = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES)
+    db.row_factory = sqlite3.Row
+    db.execute("PRAGMA foreign_keys = ON")
+    return db
+
+
+def schema(db: sqlite3.Connection):
+    tables = [
+        row["name"] for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"
+        )
+    ]
+    return {
+        table: [(row["name"], row["type"], row["notnull"]) for row in db.execute(f"PRAGMA table_info({table})")]
+        for table in tables
+    }
+
+
+@pytest.fixture
+def baseline(tmp_path):
+    db = connect(str(tmp_path / "events.db"))
+    db.executescript(BASELINE)
+    yield db
+    db.close()
+
+
+def test_baseline_database_upgrades_to_current_schema(baseline, tmp_path):
+    initdb.init_db(baseline)
+
+    fresh = connect(str(tmp_path / "fresh.db"))
+    initdb.init_db(fresh)
+    assert schema(baseline) == schema(fresh)
+    fresh.close()
+
+    assert baseline.execute("PRAGMA user_version").fetchone()[0] == len(initdb.MIGRATIONS)
+
+    event = model.Events(baseline).get("party")
+    assert event.title == "Party"
+    assert [guest.name for guest in model.Guests(baseline).get_all(event.id)] == ["zelda"]
+    row = baseline.execute("SELECT eventstylehash FROM event").fetchone()
+    assert row["eventstylehash"] == model.style_digest("p{color:red}")
+
+
+def test_upgrade_is_idempotent(baseline):
+    initdb.init_db(baseline)
+    before = schema(baseline)
+    initdb.init_db(baseline)
+    assert schema(baseline) == before
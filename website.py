@@ -1,16 +1,51 @@
+from typing import Optional
+import dataclasses
 import datetime
 import functools
 import inspect
-import sqlite3
-import uuid
+import json
+import queue
+import secrets
+import time
 
 import flask
-import markdown
-
+import jinja2
+import markupsafe
+import werkzeug.exceptions
+
+import cache
+import coherence
+import compression
+import config
+import maintain
 import model
+import pubsub
+import ratelimit
+import render
+import storage
+
+
+views = flask.Blueprint("views", __name__)
+
+DB_POOL_SIZE = 8
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE = 50
+STREAM_HEARTBEAT_SECONDS = 15
 
+# limits are set from config in create_app
+issue_limiter = ratelimit.RateLimiter(rate=1, burst=20)
+password_limiter = ratelimit.RateLimiter(rate=0.1, burst=10)
+load_shedder = ratelimit.LoadShedder(max_in_flight=None, max_latency=None)
 
-app = flask.Flask(__name__)
+# event id -> rendered event page, for requests without query arguments
+pages = cache.TTLCache(maxsize=256, ttl=300)
+coherence.watcher.listen("event", pages.pop)
+coherence.watcher.listen("pruned", lambda _: pages.clear())
+
+# content hash -> css, for /style/<hash>.css
+styles = cache.TTLCache(maxsize=1024, ttl=None)
+
+_db_pool = queue.Queue(maxsize=DB_POOL_SIZE)
 
 DEFAULT_STYLE = """
 body {
@@ -60,29 +95,134 @@ def slugify(s: str) -> str:
     return ''.join((c if c.isalnum() else '-') for c in s)
 
 
-def get_db():
+@views.app_template_global()
+def style_url(style: str) -> str:
+    digest = model.style_digest(style)
+    styles.put(digest, style)
+    return flask.url_for(".style", digest=digest)
+
+
+@views.app_template_filter("highlight")
+def highlight(snippet: str) -> markupsafe.Markup:
+    escaped = str(markupsafe.escape(snippet))
+    return markupsafe.Markup(
+        escaped.replace(model.MATCH_START, "<mark>").replace(model.MATCH_END, "</mark>")
+    )
+
+
+def connect_db() -> storage.Engine:
+    return storage.connect()
+
+
+def get_db() -> storage.Engine:
     if 'db' not in flask.g:
-        flask.g.db = sqlite3.connect(
-            "events.db",
-            detect_types=sqlite3.PARSE_DECLTYPES,
-        )
-        flask.g.db.row_factory = sqlite3.Row
+        try:
+            flask.g.db = _db_pool.get_nowait()
+        except queue.Empty:
+            flask.g.db = connect_db()
 
     return flask.g.db
 
 
-@app.teardown_appcontext
+def get_events():
+    return get_db().events()
+
+
+def get_guests():
+    return get_db().guests()
+
+
+def get_tokens():
+    return get_db().tokens()
+
+
+def get_archive():
+    return get_db().archive()
+
+
+@views.before_app_request
+def shed_load():
+    # refuse work before touching the database once we're falling behind
+    if not load_shedder.enter():
+        raise werkzeug.exceptions.ServiceUnavailable(retry_after=1)
+    flask.g.request_started = time.perf_counter()
+
+
+@views.teardown_app_request
+def finish_request(exception=None):
+    started = flask.g.pop("request_started", None)
+    if started is not None:
+        load_shedder.leave(time.perf_counter() - started)
+
+
+def check_rate(limiter: ratelimit.RateLimiter, *keys) -> None:
+    for key in keys:
+        if not limiter.allow(key):
+            raise werkzeug.exceptions.TooManyRequests(retry_after=limiter.retry_after())
+
+
+def check_password_rate(*target) -> None:
+    check_rate(password_limiter, ("client", flask.request.remote_addr), target)
+
+
+@views.after_app_request
+def compress(response: flask.Response) -> flask.Response:
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    if response.mimetype not in compression.COMPRESSIBLE or "Content-Encoding" in response.headers:
+        return response
+
+    response.vary.add("Accept-Encoding")
+
+    encoding = compression.choose_encoding(flask.request.accept_encodings)
+    body = response.get_data()
+    if encoding is not None and len(body) >= compression.MIN_SIZE:
+        response.set_data(compression.compress(body, encoding))
+        response.headers["Content-Encoding"] = encoding
+
+    # tagged after compressing so each encoding gets its own etag
+    if flask.request.method == "GET" and response.status_code == 200:
+        response.add_etag()
+        response.make_conditional(flask.request)
+
+    return response
+
+
+@views.before_app_request
+def check_coherence():
+    get_db().check_coherence()
+
+
 def close_db(exception=None):
     try:
         db = flask.g.pop('db')
     except KeyError:
         pass
     else:
+        db.rollback()
+        try:
+            _db_pool.put_nowait(db)
+        except queue.Full:
+            db.close()
+
+
+def warm_up(app: flask.Flask):
+    # pay the one-off costs up front so the first request is as fast as the rest
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+
+    render.render_markdown(DEFAULT_DESCRIPTION)
+
+    db = connect_db()
+    db.warm_up()
+    try:
+        _db_pool.put_nowait(db)
+    except queue.Full:
         db.close()
 
 
-def get_token(db) -> model.Token:
-    tokens = model.Tokens(db)
+def get_token() -> model.Token:
+    tokens = get_tokens()
     name = flask.request.cookies.get("token", "")
     token = tokens.get(name)
 
@@ -94,10 +234,12 @@ def get_token(db) -> model.Token:
     return tokens.get(name)
 
 
-def issue_token(db) -> model.Token:
-    tokens = model.Tokens(db)
+def issue_token() -> model.Token:
+    check_rate(issue_limiter, flask.request.remote_addr)
+
+    tokens = get_tokens()
     while True:
-        name = uuid.uuid4().hex
+        name = secrets.token_hex(16)
         try:
             tokens.create(name)
         except model.AlreadyExistsError:
@@ -108,64 +250,124 @@ def issue_token(db) -> model.Token:
 
 
 def with_token(func):
-    sig = inspect.signature(func)
+    # introspect once here rather than on every request
+    wants_token = "token" in inspect.signature(func).parameters
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        db = get_db()
         try:
-            token = get_token(db)
+            token = get_token()
         except LookupError:
-            token = issue_token(db)
-        
-        if "token" in sig.parameters:
-            phantom = sig.replace(parameters=(v for v in sig.parameters.values() if v.name != "token"))
-            binding = phantom.bind_partial(*args, **kwargs)
-            binding.arguments["token"] = token
-            response = func(**binding.arguments)
-        else:
-            response = func(*args, **kwargs)
-        
-        response = flask.make_response(response)
-        response.set_cookie("token", token.name)
+            token = issue_token()
+
+        if wants_token:
+            kwargs["token"] = token
+
+        response = flask.make_response(func(*args, **kwargs))
+
+        # a token's name never changes, so only send it if the browser lacks it
+        if flask.request.cookies.get("token") != token.name:
+            response.set_cookie("token", token.name)
         return response
 
     return wrapper
 
 
-@app.route("/")
+@views.route("/")
 @with_token
 def home():
-    events = model.Events(get_db()).get_all()
+    events = get_events().get_all()
     error = flask.request.args.get("error")
     return flask.render_template("home.html", error=error, events=events)
 
 
-@app.route("/admin")
+@views.route("/admin")
 @with_token
 def admin():
     error = flask.request.args.get("error")
     return flask.render_template("admin.html", error=error)
 
 
-@app.route("/<name>")
+@views.route("/search")
 @with_token
-def event(name: str):
-    db = get_db()
+def search():
+    query = flask.request.args.get("q", "")
+    page = min(max(flask.request.args.get("page", 1, type=int), 1), SEARCH_MAX_PAGE)
+    event_name = flask.request.args.get("event")
+
+    offset = (page - 1) * SEARCH_PAGE_SIZE
 
+    # fetch one extra match to find out whether there is a next page
+    if event_name:
+        try:
+            event = get_events().get(event_name)
+        except LookupError:
+            return f"event {event_name!r} not found", 404
+
+        matches = get_guests().search(event.id, query, SEARCH_PAGE_SIZE + 1, offset)
+    else:
+        event = None
+        matches = get_events().search(query, SEARCH_PAGE_SIZE + 1, offset)
+
+    return flask.render_template(
+        "search.html",
+        query=query,
+        page=page,
+        event=event,
+        matches=matches[:SEARCH_PAGE_SIZE],
+        more=len(matches) > SEARCH_PAGE_SIZE and page < SEARCH_MAX_PAGE,
+    )
+
+
+@views.route("/style/<digest>.css")
+def style(digest: str):
+    css = styles.get(digest)
+    if css is None:
+        # rendered by another worker
+        try:
+            css = get_events().get_style(digest)
+        except LookupError:
+            return f"style {digest!r} not found", 404
+        styles.put(digest, css)
+
+    response = flask.make_response(css)
+    response.mimetype = "text/css"
+    # the url changes whenever the content does
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+
+@views.route("/<name>")
+@with_token
+def event(token: model.Token, name: str):
     try:
-        event = model.Events(db).get(name)
+        event = get_events().get(name)
     except LookupError:
         return f"event {name!r} not found", 404
 
-    guests = model.Guests(db).get_all(event.id)
+    # the page is the same for everyone unless a form is being refilled, or
+    # it's an admin, who gets to restore archived events
+    cacheable = not flask.request.args and not token.admin
+    if cacheable:
+        page = pages.get(event.id)
+        if page is not None:
+            return page
+        generation = pages.generation
+
+    archived = isinstance(event, model.ArchivedEvent)
+    if archived:
+        guests = event.guests
+    else:
+        guests = get_guests().get_all(event.id)
 
-    return flask.render_template(
+    page = flask.render_template(
         "event.html",
         name=name,
+        archived=archived,
+        admin=token.admin,
         title=event.title,
         style=event.style,
-        desc=markdown.markdown(event.desc),
+        desc=render.render_markdown(event.desc),
         error=flask.request.args.get("error"),
         guestname=flask.request.args.get("guestname"),
         guestcomment=flask.request.args.get("comment"),
@@ -174,15 +376,21 @@ def event(name: str):
         bailing=[(guest.name, guest.title, guest.comment) for guest in guests if not guest.going],
     )
 
+    if cacheable:
+        pages.put(event.id, page, generation=generation)
+
+    return page
 
-@app.route("/<name>/edit")
+
+@views.route("/<name>/edit")
 @with_token
 def edit_event(token: model.Token, name: str):
-    db = get_db()
-    events = model.Events(db)
+    events = get_events()
 
     try:
-        event = events.get(name)
+        event = events.get_live(name)
+    except model.ArchivedError:
+        return f"event {name!r} is archived", 409
     except LookupError:
         return f"event {name!r} not found", 404
 
@@ -201,14 +409,15 @@ def edit_event(token: model.Token, name: str):
     )
 
 
-@app.route("/<name>/delete")
+@views.route("/<name>/delete")
 @with_token
 def delete_event(token: model.Token, name: str):
-    db = get_db()
-    events = model.Events(db)
+    events = get_events()
 
     try:
-        event = events.get(name)
+        event = events.get_live(name)
+    except model.ArchivedError:
+        return f"event {name!r} is archived", 409
     except LookupError:
         return f"event {name!r} not found", 404
 
@@ -226,15 +435,16 @@ def delete_event(token: model.Token, name: str):
     )
 
 
-@app.route("/<event_name>/guest/<name>")
+@views.route("/<event_name>/guest/<name>")
 @with_token
 def edit_guest(token: model.Token, event_name: str, name: str):
-    db = get_db()
-    events = model.Events(db)
-    guests = model.Guests(db)
+    events = get_events()
+    guests = get_guests()
 
     try:
-        event = events.get(event_name)
+        event = events.get_live(event_name)
+    except model.ArchivedError:
+        return f"event {event_name!r} is archived", 409
     except LookupError:
         return f"event {event_name!r} not found", 404
     
@@ -260,15 +470,16 @@ def edit_guest(token: model.Token, event_name: str, name: str):
     )
 
 
-@app.route("/<event_name>/guest/<name>/delete")
+@views.route("/<event_name>/guest/<name>/delete")
 @with_token
 def delete_guest(token: model.Token, event_name: str, name: str):
-    db = get_db()
-    events = model.Events(db)
-    guests = model.Guests(db)
+    events = get_events()
+    guests = get_guests()
 
     try:
-        event = events.get(event_name)
+        event = events.get_live(event_name)
+    except model.ArchivedError:
+        return f"event {event_name!r} is archived", 409
     except LookupError:
         return f"event {event_name!r} not found", 404
     
@@ -292,7 +503,7 @@ def delete_guest(token: model.Token, event_name: str, name: str):
     )
 
 
-@app.route("/api/event", methods=["POST"])
+@views.route("/api/event", methods=["POST"])
 @with_token
 def api_create_event(token: model.Token):
     title = flask.request.form["name"].strip()
@@ -300,11 +511,10 @@ def api_create_event(token: model.Token):
     password = flask.request.form["password"]
 
     if not name:
-        url = flask.url_for("home", error="name must not be empty")
+        url = flask.url_for(".home", error="name must not be empty")
         return flask.redirect(url)
 
-    db = get_db()
-    events = model.Events(db)
+    events = get_events()
 
     try:
         events.create(
@@ -316,34 +526,34 @@ def api_create_event(token: model.Token):
         )
     except model.AlreadyExistsError:
         url = flask.url_for(
-            "home", error="there is already an event with that name slug",
+            ".home", error="there is already an event with that name slug",
         )
         return flask.redirect(url)
     
     events.approve_token(name, token, password)
 
-    url = flask.url_for("edit_event", name=name)
+    url = flask.url_for(".edit_event", name=name)
     return flask.redirect(url)
 
 
-@app.route("/api/event/<name>", methods=["POST"])
+@views.route("/api/event/<name>", methods=["POST"])
 @with_token
 def api_update_event(token: model.Token, name: str):
     print("name", name)
     if not name:
         return "not found", 404
 
-    db = get_db()
-    events = model.Events(db)
+    events = get_events()
 
     try:
         authorized = events.check_token(name, token)
         if not authorized:
             password = flask.request.form.get("password", "")
+            check_password_rate("event", name)
             try:
                 events.approve_token(name, token, password)
             except PermissionError:
-                url = flask.url_for("edit_event", name=name, error="bad password or token expired")
+                url = flask.url_for(".edit_event", name=name, error="bad password or token expired")
                 return flask.redirect(url)
 
         events.update(
@@ -354,39 +564,57 @@ def api_update_event(token: model.Token, name: str):
         )
     except LookupError:
         pass
+    except ValueError as e:
+        url = flask.url_for(".edit_event", name=name, error=str(e))
+        return flask.redirect(url)
 
-    url = flask.url_for("event", name=name)
+    url = flask.url_for(".event", name=name)
     return flask.redirect(url)
 
 
-@app.route("/api/event/<name>/delete", methods=["POST"])
+@views.route("/api/event/<name>/delete", methods=["POST"])
 @with_token
 def api_delete_event(token: model.Token, name: str):
     if not name:
         return "not found", 404
 
-    db = get_db()
-    events = model.Events(db)
+    events = get_events()
 
     try:
         authorized = events.check_token(name, token)
         if not authorized:
             password = flask.request.form.get("password", "")
+            check_password_rate("event", name)
             try:
                 events.approve_token(name, token, password)
             except PermissionError:
-                url = flask.url_for("delete_event", name=name, error="bad password or token expired")
+                url = flask.url_for(".delete_event", name=name, error="bad password or token expired")
                 return flask.redirect(url)
 
         events.delete(name=name)
     except LookupError:
         pass
 
-    url = flask.url_for("home")
+    url = flask.url_for(".home")
+    return flask.redirect(url)
+
+
+@views.route("/api/event/<name>/restore", methods=["POST"])
+@with_token
+def api_restore_event(token: model.Token, name: str):
+    if not token.admin:
+        return "admins only", 403
+
+    try:
+        get_archive().restore(name)
+    except LookupError:
+        return f"event {name!r} is not archived", 404
+
+    url = flask.url_for(".event", name=name)
     return flask.redirect(url)
 
 
-@app.route("/api/event/<event_name>/guest", methods=["POST"])
+@views.route("/api/event/<event_name>/guest", methods=["POST"])
 @with_token
 def api_create_guest(token: model.Token, event_name: str):
     if not event_name:
@@ -400,7 +628,7 @@ def api_create_guest(token: model.Token, event_name: str):
 
     if not name:
         url = flask.url_for(
-            "event",
+            ".event",
             name=event_name,
             guestname=title,
             going=going,
@@ -409,15 +637,15 @@ def api_create_guest(token: model.Token, event_name: str):
         )
         return flask.redirect(url)
 
-    db = get_db()
-
-    events = model.Events(db)
+    events = get_events()
     try:
-        event = events.get(event_name)
+        event = events.get_live(event_name)
+    except model.ArchivedError:
+        return f"event {event_name!r} is archived", 409
     except LookupError:
         return f"no such event {event_name}", 404
 
-    guest_table = model.Guests(db)
+    guest_table = get_guests()
 
     try:
         guest_table.create(
@@ -430,7 +658,7 @@ def api_create_guest(token: model.Token, event_name: str):
         )
     except model.AlreadyExistsError:
         url = flask.url_for(
-            "event",
+            ".event",
             name=event_name,
             guestname=title,
             going=going,
@@ -441,11 +669,11 @@ def api_create_guest(token: model.Token, event_name: str):
 
     guest_table.approve_token(event.id, name, token, password)
 
-    url = flask.url_for("event", name=event_name)
+    url = flask.url_for(".event", name=event_name)
     return flask.redirect(url)
 
 
-@app.route("/api/event/<event_name>/guest/<name>", methods=["POST"])
+@views.route("/api/event/<event_name>/guest/<name>", methods=["POST"])
 @with_token
 def api_update_guest(token: model.Token, event_name: str, name: str):
     if not event_name or not name:
@@ -454,25 +682,26 @@ def api_update_guest(token: model.Token, event_name: str, name: str):
     comment = flask.request.form["comment"].strip()
     going = flask.request.form["going"] == "going"
 
-    db = get_db()
-
-    events = model.Events(db)
+    events = get_events()
     try:
-        event = events.get(event_name)
+        event = events.get_live(event_name)
+    except model.ArchivedError:
+        return f"event {event_name!r} is archived", 409
     except LookupError:
         return f"no such event {event_name}", 404
 
-    guest_table = model.Guests(db)
+    guest_table = get_guests()
 
     try:
         authorized = guest_table.check_token(event.id, name, token)
         if not authorized:
             password = flask.request.form.get("password", "")
+            check_password_rate("guest", event.id, name)
             try:
                 guest_table.approve_token(event.id, name, token, password)
             except PermissionError:
                 url = flask.url_for(
-                    "edit_guest",
+                    ".edit_guest",
                     event_name=event_name,
                     name=name,
                     error="bad password or token expired",
@@ -488,35 +717,36 @@ def api_update_guest(token: model.Token, event_name: str, name: str):
     except LookupError as e:
         pass
 
-    url = flask.url_for("event", name=event_name)
+    url = flask.url_for(".event", name=event_name)
     return flask.redirect(url)
 
 
-@app.route("/api/event/<event_name>/guest/<name>/delete", methods=["POST"])
+@views.route("/api/event/<event_name>/guest/<name>/delete", methods=["POST"])
 @with_token
 def api_delete_guest(token: model.Token, event_name: str, name: str):
     if not event_name or not name:
         return "not found", 404
 
-    db = get_db()
-
-    events = model.Events(db)
+    events = get_events()
     try:
-        event = events.get(event_name)
+        event = events.get_live(event_name)
+    except model.ArchivedError:
+        return f"event {event_name!r} is archived", 409
     except LookupError:
         return f"no such event {event_name}", 404
 
-    guest_table = model.Guests(db)
+    guest_table = get_guests()
 
     try:
         authorized = guest_table.check_token(event.id, name, token)
         if not authorized:
             password = flask.request.form.get("password", "")
+            check_password_rate("guest", event.id, name)
             try:
                 guest_table.approve_token(event.id, name, token, password)
             except PermissionError:
                 url = flask.url_for(
-                    "delete_guest",
+                    ".delete_guest",
                     event_name=event_name,
                     name=name,
                     error="bad password or token expired",
@@ -530,42 +760,135 @@ def api_delete_guest(token: model.Token, event_name: str, name: str):
     except LookupError as e:
         pass
 
-    url = flask.url_for("event", name=event_name)
+    url = flask.url_for(".event", name=event_name)
     return flask.redirect(url)
 
 
-@app.route("/api/admin", methods=["POST"])
+@views.route("/api/event/<name>/stream")
+def api_event_stream(name: str):
+    try:
+        event = get_events().get_live(name)
+    except model.ArchivedError:
+        return f"event {name!r} is archived", 409
+    except LookupError:
+        return f"event {name!r} not found", 404
+
+    # subscribe before taking the snapshot so no change falls in between
+    subscription = pubsub.broker.subscribe(model.guest_topic(event.id))
+    snapshot = {
+        "op": "snapshot",
+        "guests": [
+            model.guest_change("create", guest)["guest"]
+            for guest in get_guests().get_all(event.id)
+        ],
+    }
+
+    def stream():
+        try:
+            yield f"data: {json.dumps(snapshot)}\n\n"
+            while not subscription.overflowed:
+                try:
+                    change = subscription.queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"
+                else:
+                    yield f"data: {json.dumps(change)}\n\n"
+
+            # we dropped changes, so the page is out of date
+            yield "event: reload\ndata: {}\n\n"
+        finally:
+            pubsub.broker.unsubscribe(subscription)
+
+    return flask.Response(
+        stream(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@views.route("/api/admin", methods=["POST"])
 @with_token
 def api_admin(token: model.Token):
     password = flask.request.form.get("password")
+    check_password_rate("admin")
 
     try:
-        model.Tokens(get_db()).set_admin(token.name, password)
+        get_tokens().set_admin(token.name, password)
     except PermissionError:
-        url = flask.url_for("admin", error="bad password")
+        url = flask.url_for(".admin", error="bad password")
         return flask.redirect(url)
     
-    url = flask.url_for("home")
+    url = flask.url_for(".home")
     return flask.redirect(url)
 
 
 
-@app.route("/api/revoke")
+@views.route("/api/stats")
+@with_token
+def api_stats(token: model.Token):
+    if not token.admin:
+        return "admins only", 403
+
+    return flask.jsonify(
+        auth_cache=model.auth_cache.stats(),
+        pages=pages.stats(),
+        compressed=compression.compressed.stats(),
+    )
+
+
+@views.route("/api/revoke")
 def api_revoke():
-    db = get_db()
     try:
-        token = get_token(db)
+        token = get_token()
     except LookupError:
         pass
     else:
-        model.Tokens(db).delete(token.name)
+        get_tokens().delete(token.name)
 
-    token = issue_token(db)
+    token = issue_token()
 
-    url = flask.request.args.get("redirect", flask.url_for('home'))
+    url = flask.request.args.get("redirect", flask.url_for('.home'))
     response = flask.redirect(url)
     response.set_cookie("token", token.name)
     return response
 
+def create_app(settings: Optional[config.Config] = None) -> flask.Flask:
+    if settings is not None:
+        config.configure(settings)
+
+    # pooled connections may be to storage from an earlier config
+    while True:
+        try:
+            _db_pool.get_nowait().close()
+        except queue.Empty:
+            break
+
+    app = flask.Flask(__name__)
+    app.jinja_options = {
+        **app.jinja_options,
+        "bytecode_cache": jinja2.FileSystemBytecodeCache(config.get().template_cache_dir),
+    }
+    model.auth_cache.maxsize = config.get().auth_cache_size
+    model.auth_cache.ttl = config.get().auth_cache_ttl
+    issue_limiter.rate = config.get().issue_rate
+    issue_limiter.burst = config.get().issue_burst
+    password_limiter.rate = config.get().password_rate
+    password_limiter.burst = config.get().password_burst
+    load_shedder.max_in_flight = config.get().max_in_flight
+    load_shedder.max_latency = config.get().max_latency
+
+    app.register_blueprint(views)
+    app.teardown_appcontext(close_db)
+
+    if config.get().warm_up:
+        warm_up(app)
+
+    if config.get().maintenance and config.get().storage == "sqlite":
+        throttle = maintain.Throttle(sleep=config.get().maintenance_sleep, busy=load_shedder.busy)
+        maintain.Scheduler(throttle).start()
+
+    return app
+
+
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app(dataclasses.replace(config.Config.from_env(), warm_up=True)).run(debug=True)